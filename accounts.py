@@ -1,17 +1,73 @@
 from __future__ import annotations
 
 from decimal import Decimal
-from exceptions import OverdrawError, TransactionSequenceError, TransactionLimitError, TransactionDateError
-from sqlalchemy import Integer, String, ForeignKey, DateTime, Text, Column
+from exceptions import OverdrawError, TransactionSequenceError, TransactionLimitError, TransactionDateError, ConcurrentUpdateError
+from sqlalchemy import Integer, String, ForeignKey, DateTime, Date, Text, Column, Index, select, tuple_, func
 from sqlalchemy.orm import mapped_column, relationship, backref
 from sqlalchemy.orm import Mapped
+from sqlalchemy.orm.exc import StaleDataError
 from bank import Base
-from sqlalchemy.ext.mutable import MutableList
-from sqlalchemy.dialects.postgresql import ARRAY
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Iterator, NamedTuple
+
+from transactions import Transaction, last_day_of_month
+from money import Cents, round_cents
+from counters import TransactionCounter, DAY, MONTH, period_start
+from checkpoints import BalanceCheckpoint
+from logsetup import audit
+
+
+# how many times to re-check a transaction after another writer changed the account first
+RETRY_ATTEMPTS = 5
+
+
+def commit_with_retry(session, stage, attempts=RETRY_ATTEMPTS):
+    """Runs stage() to check and add transactions to the session, then commits.
+    Accounts carry a version number that the commit checks, so if another session changed one
+    of the accounts in the meantime, everything is rolled back and stage() runs again against
+    the newly committed state.
+
+    Args:
+        stage (callable): adds the changes to the session. It may return False to skip the commit.
+
+    Returns:
+        whatever stage() returned
+    """
+    for _ in range(attempts):
+        try:
+            result = stage()
+            if result is not False:
+                session.commit()
+            return result
+        except StaleDataError:
+            # expires the accounts, so the rules are checked against the current balances
+            session.rollback()
+    raise ConcurrentUpdateError(attempts)
+
+
+def audit_transaction(acct_num, amt, date, exempt=False, error=None) -> None:
+    """Writes the audit record for a transaction that was committed, or rejected with error.
+    The amount is recorded rounded to the cent, as Transaction stores it, not as it was given.
+    """
+    audit("transaction", account=acct_num, amount=round_cents(amt), date=date, exempt=exempt,
+          outcome="rejected" if error else "accepted",
+          reason=type(error).__name__ if error else None)
+
+
+class ImportResult(NamedTuple):
+    "Outcome of one row of a batch of transactions"
+    row: int
+    account_number: int
+    accepted: bool
+    error: Exception | None = None
+
+
+def summary_line(acct_type, acct_num, balance) -> str:
+    """Formats a row of Bank.summary the same way str() formats the account.
+    For example, 'Savings#000000001,<tab>balance: $50.00'
+    """
+    return f"{acct_type.capitalize()}#{acct_num:09},\tbalance: ${balance:,.2f}"
 
-from transactions import Transaction
-import logging
 
 class Account(Base):
     """This is an abstaact class for accounts.  Provides default functionality for adding transactions, getting balances, and assessing interest and fees.  
@@ -22,15 +78,32 @@ class Account(Base):
     _bank_id = mapped_column(Integer, ForeignKey("bank._id"))
     _account_number = mapped_column(Integer)
     _account_type = mapped_column(String)
-    _transactions = relationship("Transaction", backref=backref("_account"))
-
+    # running total of _transactions, updated in the same commit as each insert.
+    # the transactions are still the source of truth (see Bank.reconcile)
+    _balance = mapped_column("_balance_cents", Cents, nullable=False, default=Decimal(0), server_default="0")
+    # incremented on every update and checked at commit, so two processes can't both
+    # pass the overdraft and limit checks against the same old balance
+    _version = mapped_column(Integer, nullable=False, server_default="1")
+    # dates of the newest transaction and the newest exempt (interest/fee) transaction,
+    # so the sequence and month-end checks don't have to scan _transactions
+    _latest_date = mapped_column(Date)
+    _latest_exempt_date = mapped_column(Date)
+    # transactions can only be added in date order, so appending keeps this list sorted
+    _transactions = relationship("Transaction", backref=backref("_account"),
+                                 order_by="(Transaction._date, Transaction._id)")
+
+    __table_args__ = (
+        Index("ix_account_bank_number", "_bank_id", "_account_number", unique=True),
+    )
     __mapper_args__ = {
         'polymorphic_identity': 'account',
-        'polymorphic_on': _account_type
+        'polymorphic_on': _account_type,
+        'version_id_col': _version
     }
 
     def __init__(self, acct_num) -> None:
         self._account_number = acct_num
+        self._balance = Decimal(0)
 
     def _get_acct_num(self) -> int:
         return self._account_number
@@ -45,26 +118,97 @@ class Account(Base):
             date (Date): Date for the new transaction.
             exempt (bool, optional): Determines whether the transaction is exempt from account limits. Defaults to False.
         """
-        t = Transaction(amt, date, exempt)
-        
+        try:
+            commit_with_retry(session, lambda: self._stage_transaction(session, Transaction(amt, date, exempt)))
+        except (OverdrawError, TransactionSequenceError, TransactionLimitError, ConcurrentUpdateError) as e:
+            audit_transaction(self._account_number, amt, date, exempt, e)
+            raise
+        audit_transaction(self._account_number, amt, date, exempt)
+
+    def add_transactions(self, session, batch) -> list[ImportResult]:
+        """Checks a batch of transactions against the account rules in order and adds the allowed ones with a single commit.
+
+        Args:
+            batch (iterable): (amount, date) or (amount, date, exempt) tuples, in date order
+
+        Returns:
+            list[ImportResult]: whether each row was accepted, and the error for rejected rows
+        """
+        batch = list(batch)
+
+        def stage():
+            results = []
+            counters = {}
+            with session.no_autoflush:
+                for row, (amt, date, *exempt) in enumerate(batch):
+                    try:
+                        self._stage_transaction(session, Transaction(amt, date, *exempt), counters)
+                        results.append(ImportResult(row, self._account_number, True))
+                    except (OverdrawError, TransactionSequenceError, TransactionLimitError) as e:
+                        results.append(ImportResult(row, self._account_number, False, e))
+            return results
+
+        results = commit_with_retry(session, stage)
+        for (amt, date, *exempt), result in zip(batch, results):
+            audit_transaction(self._account_number, amt, date, *exempt, result.error)
+        return results
+
+    def _stage_transaction(self, session, t, counters=None) -> bool:
+        """Checks whether a transaction is allowed and, if it is, adds it to the account and session without committing.
+
+        Args:
+            t (Transaction): pending transaction
+            counters (dict, optional): counters already looked up in this batch, see _get_counter
+
+        Returns:
+            bool: true if the transaction was added
+        """
+        day = t._date.date() if isinstance(t._date, datetime) else t._date
+        if counters is None:
+            # checking and adding look up the same counters, and session.get can't see a missing one was already looked for
+            counters = {}
+        if self._check_transaction(session, t, day, counters):
+            self._add_checked_transaction(session, t, day, counters)
+            return True
+        return False
+
+    def _check_transaction(self, session, t, day, counters=None) -> bool:
+        """Checks a pending transaction against the account rules without changing anything.
+
+        Args:
+            t (Transaction): pending transaction
+            day (Date): date of the pending transaction
+            counters (dict, optional): counters already looked up in this batch
+
+        Returns:
+            bool: true if the transaction is allowed
+        """
         # Logic is broken up into pieces and factored out into other methods.
         # This makes it easier to override specific parts of add_transaction.
         # This is called a Template Method design pattern
-        if self._transactions: 
-            latest_transaction = max(self._transactions, key=lambda trans: trans._date) # make sure its using datetime.date
-            latest_date = latest_transaction._date.date() if isinstance(latest_transaction._date, datetime) else latest_transaction._date
-            if date < latest_date: 
-                raise TransactionSequenceError(error_type="balance", latest_date=latest_date)
+        if self._latest_date is not None and day < self._latest_date: 
+            raise TransactionSequenceError(error_type="balance", latest_date=self._latest_date)
         balance_ok = self._check_balance(t)
         if (balance_ok == False and not t.is_exempt()): 
             raise OverdrawError()
         
-        limits_ok = self._check_limits(t)
-        if t.is_exempt() or (balance_ok and limits_ok):
-            logging.debug(f"Created transaction: {self._account_number} {amt}")
-            self._transactions.append(t)
-            session.add(t)
-            session.commit()
+        limits_ok = self._check_limits(session, t, day, counters)
+        return t.is_exempt() or (balance_ok and limits_ok)
+
+    def _add_checked_transaction(self, session, t, day, counters=None) -> None:
+        "Adds a transaction that passed _check_transaction to the account and session, and updates the running balance, dates, counters and checkpoint"
+        # setting the backref adds t to _transactions without loading the whole list
+        session.add(t)
+        t._account = self
+        self._balance += t._amt
+        self._latest_date = day
+        if t.is_exempt():
+            self._latest_exempt_date = day
+        else:
+            for period_type in (DAY, MONTH):
+                self._get_counter(session, period_type, day, create=True, counters=counters).increment()
+        # transactions arrive in date order, so the new balance is the month's closing balance so far
+        self._get_checkpoint(session, day, counters).set_balance(self._balance)
 
     def _check_balance(self, t) -> bool:
         """Checks whether an incoming transaction would overdraw the account
@@ -77,47 +221,138 @@ class Account(Base):
         """
         return t.check_balance(self.get_balance())
 
-    def _check_limits(self, t) -> bool:
+    def _check_limits(self, session, t, day, counters=None) -> bool:
         return True
 
+    def _get_counter(self, session, period_type, day, create=False, counters=None) -> TransactionCounter | None:
+        """Looks up the counter of non-exempt transactions for the day or month containing day.
+
+        Args:
+            period_type (str): DAY or MONTH
+            day (Date): any date in the period
+            create (bool, optional): Adds a new zero counter to the session if there isn't one yet. Defaults to False.
+            counters (dict, optional): counters looked up earlier in an unflushed batch. session.get
+                can't see pending objects, so new counters are remembered here. Defaults to None.
+        """
+        key = (self._id, period_type, period_start(period_type, day))
+        if counters is not None and key in counters:
+            # a missing counter is remembered as None, so it isn't looked up again
+            counter = counters[key]
+        else:
+            counter = session.get(TransactionCounter, key)
+        if counter is None and create:
+            counter = TransactionCounter(*key)
+            session.add(counter)
+        if counters is not None:
+            counters[key] = counter
+        return counter
+
+    def _get_checkpoint(self, session, day, counters=None) -> BalanceCheckpoint:
+        """Looks up the balance checkpoint for the month containing day, adding a new one to the session if there isn't one yet.
+
+        Args:
+            day (Date): any date in the month
+            counters (dict, optional): objects looked up earlier in an unflushed batch, see _get_counter
+        """
+        key = (self._id, day.replace(day=1))
+        if counters is not None and key in counters:
+            return counters[key]
+        checkpoint = session.get(BalanceCheckpoint, key)
+        if checkpoint is None:
+            checkpoint = BalanceCheckpoint(*key)
+            session.add(checkpoint)
+        if counters is not None:
+            counters[key] = checkpoint
+        return checkpoint
+
+    def balance_as_of(self, session, day) -> Decimal:
+        """Gets the balance at the end of a past day from the closing balance of the latest earlier month
+        plus the transactions in day's month up to day, so the cost doesn't grow with the account's age.
+
+        Args:
+            day (Date): date to get the closing balance for
+
+        Returns:
+            Decimal: balance after all the transactions on or before day
+        """
+        day = day.date() if isinstance(day, datetime) else day
+        if self._latest_date is None or day >= self._latest_date:
+            return self.get_balance()
+        month = day.replace(day=1)
+        opening = session.scalar(
+            select(BalanceCheckpoint._balance)
+            .where(BalanceCheckpoint._account_id == self._id, BalanceCheckpoint._month < month)
+            .order_by(BalanceCheckpoint._month.desc())
+            .limit(1)
+        )
+        in_month = session.scalar(
+            select(func.coalesce(func.sum(Transaction._amt), 0))
+            .where(Transaction._account_id == self._id,
+                   Transaction._date >= month,
+                   Transaction._date < day + timedelta(days=1))
+        )
+        return (opening or Decimal(0)) + in_month
+
+    def count_transactions(self, session, period_type, day) -> int:
+        """Number of non-exempt transactions on this account in the day or month containing day
+
+        Args:
+            period_type (str): DAY or MONTH
+            day (Date): any date in the period
+        """
+        return self._count(session, period_type, day)
+
+    def _count(self, session, period_type, day, counters=None) -> int:
+        counter = self._get_counter(session, period_type, day, counters=counters)
+        return counter.get_count() if counter else 0
+
     def get_balance(self) -> Decimal:
-        """Gets the balance for an account by summing its transactions
+        """Gets the balance for an account from its running total
 
         Returns:
             Decimal: current balance
         """
-        # could have a balance variable updated when transactions are added (or removed) which is faster
-        # but this is more foolproof since it's always in sync with transactions
-        # this could be improved by caching the sum to avoid too much
-        # recalculation, while still maintaining the list as the ground truth
-        return sum(self._transactions)
+        # the running total is kept in step with add_transaction, so this doesn't
+        # need to load the transactions. Bank.reconcile recomputes it from the ledger
+        return self._balance
 
-    def _assess_interest(self, latest_transaction, session) -> None:
+    def _assess_interest(self, latest_date, session) -> None:
         """Calculates interest for an account balance and adds it as a new transaction exempt from limits.
         """
-        if self._transactions: 
-            latest_transaction = max(self._transactions, key=lambda trans: trans._date)
-            if any(t for t in self._transactions if t.is_exempt() and t.in_same_month(latest_transaction)):
-                raise TransactionSequenceError(error_type="interest", latest_date=latest_transaction._date)
-        if latest_transaction == None: 
+        if latest_date == None: 
             raise TransactionDateError()
+        # transactions are added in date order, so an exempt transaction in the latest
+        # month can only be the most recent exempt one
+        exempt_date = self._latest_exempt_date
+        if exempt_date and (exempt_date.year, exempt_date.month) == (latest_date.year, latest_date.month):
+            raise TransactionSequenceError(error_type="interest", latest_date=latest_date)
         self.add_transaction(session, self.get_balance() * self._interest_rate, 
-                        date=latest_transaction.last_day_of_month(), 
+                        date=last_day_of_month(latest_date), 
                         exempt=True)
 
 
-    def _assess_fees(self, latest_transaction, session) -> None:
+    def _assess_fees(self, latest_date, session) -> None:
         pass
 
+    @classmethod
+    def _month_end_postings(cls, balance, interest=None) -> list[Decimal]:
+        """Amounts of the exempt interest and fee transactions for an account of this type with the given end-of-month balance.
+        Used by Bank.run_month_end, which works from the stored balances rather than from loaded accounts.
+
+        Args:
+            balance (Decimal): balance at the end of the month
+            interest (Decimal, optional): interest worked out another way, e.g. on the average daily balance.
+                Defaults to the flat rate on balance.
+        """
+        if interest is None:
+            interest = round_cents(balance * cls._interest_rate)
+        return [interest]
+
     def assess_interest_and_fees(self, session) -> None:
         """Used to apply interest and/or fees for this account"""
-        if not self._transactions: 
-            self._assess_interest(None, session)
-            self._assess_fees(None, session)
-            return
-        latest_transaction = max(self._transactions)
-        self._assess_interest(latest_transaction, session)
-        self._assess_fees(latest_transaction, session)
+        latest_date = self._latest_date
+        self._assess_interest(latest_date, session)
+        self._assess_fees(latest_date, session)
 
     def __str__(self) -> str:
         """Formats the account number and balance of the account.
@@ -126,8 +361,48 @@ class Account(Base):
         return f"#{self._account_number:09},\tbalance: ${self.get_balance():,.2f}"
 
     def get_transactions(self) -> list[Transaction]:
-        "Returns sorted list of transactions on this account"
-        return sorted(self._transactions)
+        "Returns list of transactions on this account, sorted by date"
+        return list(self._transactions)
+
+    def _transactions_query(self, start=None, end=None, after=None):
+        "Builds the ordered query behind iter_transactions and page_transactions"
+        query = select(Transaction).where(Transaction._account_id == self._id)
+        if start is not None:
+            query = query.where(Transaction._date >= start)
+        if end is not None:
+            query = query.where(Transaction._date < end + timedelta(days=1))
+        if after is not None:
+            query = query.where(tuple_(Transaction._date, Transaction._id) > tuple_(*after))
+        return query.order_by(Transaction._date, Transaction._id)
+
+    def iter_transactions(self, session, start=None, end=None, after=None, batch_size=1000) -> Iterator[Transaction]:
+        """Streams this account's transactions in date order, fetching batch_size rows at a time
+        so that long histories are never held in memory all at once.
+
+        Args:
+            start (Date, optional): first date to include
+            end (Date, optional): last date to include
+            after (tuple, optional): (date, id) cursor from page_transactions; only later transactions are returned
+            batch_size (int, optional): rows fetched from the database per batch. Defaults to 1000.
+        """
+        query = self._transactions_query(start, end, after).execution_options(yield_per=batch_size)
+        yield from session.scalars(query)
+
+    def page_transactions(self, session, limit, start=None, end=None, after=None) -> tuple[list[Transaction], tuple | None]:
+        """Returns one page of this account's transactions in date order using keyset pagination.
+
+        Args:
+            limit (int): maximum number of transactions on the page
+            start (Date, optional): first date to include
+            end (Date, optional): last date to include
+            after (tuple, optional): cursor returned with the previous page
+
+        Returns:
+            tuple[list[Transaction], tuple | None]: the page, and the (date, id) cursor of the next page or None after the last page
+        """
+        page = list(session.scalars(self._transactions_query(start, end, after).limit(limit)))
+        cursor = (page[-1]._date, page[-1]._id) if len(page) == limit else None
+        return page, cursor
 
 
 class SavingsAccount(Account):
@@ -144,26 +419,21 @@ class SavingsAccount(Account):
     def __init__(self, acct_num, *args, **kwargs) -> None:
         super().__init__(acct_num, *args, **kwargs)
 
-    def _check_limits(self, t1) -> bool:
+    def _check_limits(self, session, t1, day, counters=None) -> bool:
         """determines if the incoming trasaction is within the accounts transaction limits
 
         Args:
             t1 (Transaction): pending transaction to be checked
+            day (Date): date of the pending transaction
+            counters (dict, optional): counters already looked up in this batch
 
         Returns:
             bool: true if within limits and false if beyond limits
         """
-        # Count number of non-exempt transactions on the same day as t1
-
-        num_today = 0
-        for t2 in self._transactions:
-            if not t2.is_exempt() and t2.in_same_day(t1):
-                num_today += 1
-        # Count number of non-exempt transactions in the same month as t1
-        num_this_month = 0
-        for t2 in self._transactions:
-            if not t2.is_exempt() and t2.in_same_month(t1):
-                num_this_month += 1
+        # Number of non-exempt transactions on the same day and in the same month as t1,
+        # read from the counters instead of counting the transactions
+        num_today = self._count(session, DAY, day, counters)
+        num_this_month = self._count(session, MONTH, day, counters)
         # check counts against daily and monthly limits
         if num_today >= self._daily_limit:
             raise TransactionLimitError("day", self._daily_limit)
@@ -196,16 +466,23 @@ class CheckingAccount(Account):
         self._balance_threshold = 100
         self._low_balance_fee = Decimal("-5.75")
 
-    def _assess_fees(self, latest_transaction, session) -> None:
+    def _assess_fees(self, latest_date, session) -> None:
         """Adds a low balance fee if balance is below a particular threshold. Fee amount and balance threshold are defined on the CheckingAccount.
         """
-        if latest_transaction == None: 
-            raise TransactionSequenceError("balance", latest_transaction)
+        if latest_date == None: 
+            raise TransactionSequenceError("balance", latest_date)
         if self.get_balance() < self._balance_threshold:
             self.add_transaction(session, self._low_balance_fee,
-                                 date=latest_transaction.last_day_of_month(), 
+                                 date=last_day_of_month(latest_date), 
                                  exempt=True)
 
+    @classmethod
+    def _month_end_postings(cls, balance, interest=None) -> list[Decimal]:
+        postings = super()._month_end_postings(balance, interest)
+        if balance + postings[0] < cls._balance_threshold:
+            postings.append(cls._low_balance_fee)
+        return postings
+
     def __str__(self) -> str:
         """Formats the type, account number, and balance of the account.
         For example, 'Checking#000000001,<tab>balance: $50.00'
@@ -1,47 +1,112 @@
-from sqlalchemy import Integer
-from sqlalchemy.orm import relationship, backref, DeclarativeBase, mapped_column
+from decimal import Decimal
+from datetime import datetime
+from sqlalchemy import Integer, select, func, insert, update, or_, bindparam
+from sqlalchemy.orm import relationship, backref, DeclarativeBase, mapped_column, object_session, reconstructor
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 class Base(DeclarativeBase):
     pass
 
-from accounts import Account, SavingsAccount, CheckingAccount
+from accounts import Account, SavingsAccount, CheckingAccount, ImportResult, commit_with_retry, audit_transaction
+from locks import account_locks
+from logsetup import audit
+from exceptions import OverdrawError, TransactionSequenceError, TransactionLimitError, AccountNotFoundError
+from transactions import Transaction, last_day_of_month
+from counters import TransactionCounter, period_start
+from checkpoints import BalanceCheckpoint, rebuild_checkpoints
 import logging
+from typing import NamedTuple
 
 
 SAVINGS = "savings"
 CHECKING = "checking"
 
+# how run_month_end works out interest: the monthly rate on the closing balance,
+# or on the average of the balances at the end of each day of the month (see interest.py)
+FLAT_INTEREST = "flat"
+AVERAGE_DAILY_INTEREST = "average-daily"
+
+
+class TransferResult(NamedTuple):
+    "Outcome of one transfer in a batch"
+    row: int
+    source: int
+    destination: int
+    accepted: bool
+    error: Exception | None = None
+
+
 class Bank(Base):
     "This class represents a Bank that manages multiple accounts"
     __tablename__ = "bank"
     _id = mapped_column(Integer, primary_key=True)
+    # highest account number handed out so far. Incremented in the database with the
+    # same commit as the new account, so concurrent writers can't get the same number
+    _last_account_number = mapped_column(Integer, nullable=False, default=0, server_default="0")
     _accounts = relationship("Account", backref=backref("_bank"))
 
+    def __init__(self) -> None:
+        self._init_account_cache()
+
+    @reconstructor
+    def _init_account_cache(self) -> None:
+        # accounts already looked up by number, so repeated selects don't query again
+        self._account_cache = {}
+
     def add_account(self, session, acct_type) -> None:
         """Creates a new Account object and adds it to this bank object. The Account will be a SavingsAccount or CheckingAccount, depending on the type given.
 
         Args:
             type (string): "Savings" or "Checking" to indicate the type of account to create
         """
-        acct_num = self._generate_account_number()
         if acct_type == SAVINGS:
-            a = SavingsAccount(acct_num)
+            account_class = SavingsAccount
         elif acct_type == CHECKING:
-            a = CheckingAccount(acct_num)
+            account_class = CheckingAccount
         else:
             return None
-        logging.debug(f"Created account: {acct_num}")
-        self._accounts.append(a)
+        acct_num = self._generate_account_number(session)
+        a = account_class(acct_num)
+        # setting the backref adds a to _accounts without loading all of them
         session.add(a)
+        a._bank = self
         session.commit()
+        audit("account", account=acct_num, account_type=acct_type, outcome="opened")
+        self._account_cache[acct_num] = a
 
-    def _generate_account_number(self) -> int:
-        return len(self._accounts) + 1
+    def _generate_account_number(self, session) -> int:
+        """Reserves the next account number by incrementing the bank's counter in the database.
+        The row stays locked until the new account is committed.
+        """
+        increment = (update(Bank)
+                     .where(Bank._id == self._id)
+                     .values(_last_account_number=Bank._last_account_number + 1))
+        if session.get_bind().dialect.update_returning:
+            return session.execute(increment.returning(Bank._last_account_number)).scalar_one()
+        # SQLite before 3.35 has no RETURNING. The update already holds the write lock, so no other
+        # writer can change the counter before it is read back in the same transaction
+        session.execute(increment)
+        return session.execute(select(Bank._last_account_number).where(Bank._id == self._id)).scalar_one()
 
     def show_accounts(self) -> list[Account]:
         "Accessor method to return accounts"
         return self._accounts
 
+    def summary(self, session) -> list[tuple[str, int, Decimal]]:
+        """Lists the type, number and balance of every account with a single query on the stored balances,
+        without loading the accounts or their transactions.
+
+        Returns:
+            list[tuple[str, int, Decimal]]: (account type, account number, balance), ordered by account number
+        """
+        rows = session.execute(
+            select(Account._account_type, Account._account_number, Account._balance)
+            .where(Account._bank_id == self._id)
+            .order_by(Account._account_number)
+        )
+        return [tuple(row) for row in rows]
+
     def get_account(self, account_num) -> Account | None:
         """Fetches an account by its account number.
 
@@ -51,7 +116,268 @@ class Bank(Base):
         Returns:
             Account: matching account or None if not found
         """
-        for x in self._accounts:
-            if x.account_number == account_num:
-                return x
-        return None
\ No newline at end of file
+        if account_num in self._account_cache:
+            return self._account_cache[account_num]
+        session = object_session(self)
+        if session is None:
+            # not saved yet, so the accounts are only in memory
+            return next((x for x in self._accounts if x.account_number == account_num), None)
+        account = session.scalars(
+            select(Account).where(Account._bank_id == self._id, Account._account_number == account_num)
+        ).first()
+        if account is not None:
+            self._account_cache[account_num] = account
+        return account
+
+    def import_transactions(self, session, rows) -> list[ImportResult]:
+        """Checks a batch of transactions for any of this bank's accounts against the account rules, in order, and adds the allowed ones with a single commit.
+
+        Args:
+            rows (iterable): (account number, amount, date) or (account number, amount, date, exempt) tuples
+
+        Returns:
+            list[ImportResult]: whether each row was accepted, and the error for rejected rows
+        """
+        rows = list(rows)
+        results = commit_with_retry(session, lambda: self._stage_rows(session, rows))
+        for (acct_num, amt, date, *exempt), result in zip(rows, results):
+            audit_transaction(acct_num, amt, date, *exempt, result.error)
+        logging.info("Imported %d of %d transactions", sum(r.accepted for r in results), len(results))
+        return results
+
+    def _stage_rows(self, session, rows) -> list[ImportResult]:
+        """Checks rows against the account rules in order and adds the allowed ones to the session without committing.
+
+        Args:
+            rows (list): (account number, amount, date) or (account number, amount, date, exempt) tuples
+
+        Returns:
+            list[ImportResult]: whether each row was accepted, and the error for rejected rows
+        """
+        results = []
+        accounts = {}
+        counters = {}
+        with session.no_autoflush:
+            for row, (acct_num, amt, date, *exempt) in enumerate(rows):
+                if acct_num not in accounts:
+                    accounts[acct_num] = self.get_account(acct_num)
+                account = accounts[acct_num]
+                try:
+                    if account is None:
+                        raise AccountNotFoundError(acct_num)
+                    account._stage_transaction(session, Transaction(amt, date, *exempt), counters)
+                    results.append(ImportResult(row, acct_num, True))
+                except (OverdrawError, TransactionSequenceError, TransactionLimitError, AccountNotFoundError) as e:
+                    results.append(ImportResult(row, acct_num, False, e))
+        return results
+
+    def transfer(self, session, source, destination, amount, date) -> bool:
+        """Moves an amount from one account to another. The withdrawal and the deposit are both checked
+        against the account rules and are committed together, or neither is.
+
+        Args:
+            source (int): account number to withdraw from
+            destination (int): account number to deposit into
+            amount (Decimal): positive amount to move
+            date (Date): date of both transactions
+
+        Returns:
+            bool: true if the transfer was made, false if an account's rules declined it without an error
+
+        Raises:
+            OverdrawError, TransactionSequenceError, TransactionLimitError, AccountNotFoundError: if either side is rejected
+            ValueError: if the accounts are the same or the amount isn't positive
+        """
+        result = self.transfer_many(session, [(source, destination, amount, date)])[0]
+        if result.error is not None:
+            raise result.error
+        return result.accepted
+
+    def transfer_many(self, session, transfers) -> list[TransferResult]:
+        """Checks a batch of transfers in order and commits the allowed ones together. Each transfer is all or nothing.
+
+        The accounts involved are locked, in account number order, until the commit. Batches can run
+        at the same time on worker threads with their own sessions: batches that share accounts take turns,
+        and because every batch locks in the same order none of them can deadlock.
+
+        Args:
+            transfers (iterable): (source account number, destination account number, amount, date) tuples
+
+        Returns:
+            list[TransferResult]: whether each transfer was made, and the error for rejected ones. A transfer between
+            an account and itself, or of an amount that isn't positive, is rejected with ValueError.
+        """
+        transfers = list(transfers)
+        numbers = {number for source, destination, *_ in transfers for number in (source, destination)}
+        with account_locks.hold(numbers):
+            # another thread may have committed to these accounts since they were loaded
+            for number in numbers:
+                if number in self._account_cache:
+                    session.expire(self._account_cache[number])
+            results = commit_with_retry(session, lambda: self._stage_transfers(session, transfers))
+        for (source, destination, amount, date), result in zip(transfers, results):
+            audit_transaction(source, -amount, date, error=result.error)
+            audit_transaction(destination, amount, date, error=result.error)
+        return results
+
+    def _stage_transfers(self, session, transfers) -> list[TransferResult]:
+        "Checks both sides of each transfer before adding either to the session, without committing"
+        results = []
+        counters = {}
+        with session.no_autoflush:
+            for row, (source, destination, amount, date) in enumerate(transfers):
+                if source == destination:
+                    error = ValueError(f"can't transfer from account #{source:09} to itself")
+                    results.append(TransferResult(row, source, destination, False, error))
+                    continue
+                if amount <= 0:
+                    error = ValueError(f"transfer amounts must be positive, not {amount}")
+                    results.append(TransferResult(row, source, destination, False, error))
+                    continue
+                try:
+                    for number in (source, destination):
+                        if self.get_account(number) is None:
+                            raise AccountNotFoundError(number)
+                    legs = [(self.get_account(source), Transaction(-amount, date)),
+                            (self.get_account(destination), Transaction(amount, date))]
+                    day = date.date() if isinstance(date, datetime) else date
+                    # the two accounts are different, so checking one side can't change the outcome of the other
+                    if all(account._check_transaction(session, t, day, counters) for account, t in legs):
+                        for account, t in legs:
+                            account._add_checked_transaction(session, t, day, counters)
+                        results.append(TransferResult(row, source, destination, True))
+                    else:
+                        results.append(TransferResult(row, source, destination, False))
+                except (OverdrawError, TransactionSequenceError, TransactionLimitError, AccountNotFoundError) as e:
+                    results.append(TransferResult(row, source, destination, False, e))
+        return results
+
+    def run_month_end(self, session, month, interest_method=FLAT_INTEREST) -> list[tuple[int, list[Decimal]]]:
+        """Posts interest, and low balance fees for checking accounts, to every account in the bank for the given month, in a single commit.
+        Works from the stored balances with bulk inserts and updates instead of loading each account's transactions.
+        Accounts with no transactions, with transactions after the month, or that already have interest or fees in the month are skipped.
+
+        Args:
+            month (Date): any date in the month to close
+            interest_method (str, optional): FLAT_INTEREST, or AVERAGE_DAILY_INTEREST to pay each account type's
+                rate on the average daily balance, worked out for all accounts at once with NumPy. Defaults to FLAT_INTEREST.
+
+        Returns:
+            list[tuple[int, list[Decimal]]]: (account number, posted amounts) for each account that was processed
+        """
+        if interest_method not in (FLAT_INTEREST, AVERAGE_DAILY_INTEREST):
+            raise ValueError(f"unknown interest method {interest_method!r}")
+        month_start = month.replace(day=1)
+        month_end = last_day_of_month(month_start)
+        account_classes = {identity: mapper.class_ for identity, mapper in Account.__mapper__.polymorphic_map.items()}
+        accounts = Account.__table__
+        # bulk version of the ORM's version check: each update only applies if the account is unchanged
+        update_balances = (
+            update(accounts)
+            .where(accounts.c._id == bindparam("b_id"), accounts.c._version == bindparam("b_version"))
+            .values(_balance_cents=bindparam("b_balance"), _latest_date=month_end, _latest_exempt_date=month_end,
+                    _version=accounts.c._version + 1)
+        )
+        # the postings are the last transactions of the month, so they set its closing balance
+        checkpoints = BalanceCheckpoint.__table__
+        save_checkpoints = sqlite_insert(checkpoints).values(_month=month_start)
+        save_checkpoints = save_checkpoints.on_conflict_do_update(
+            index_elements=[checkpoints.c._account_id, checkpoints.c._month],
+            set_={"_balance_cents": save_checkpoints.excluded._balance_cents})
+
+        def stage():
+            interest = {}
+            if interest_method == AVERAGE_DAILY_INTEREST:
+                # imported here so that NumPy is only loaded when it's used
+                from interest import average_daily_interest
+                rates = {identity: cls._interest_rate for identity, cls in account_classes.items()
+                         if hasattr(cls, "_interest_rate")}
+                interest = average_daily_interest(session, self, month_start, month_end, rates)
+            rows = session.execute(
+                select(Account._id, Account._account_number, Account._account_type, Account._balance, Account._version)
+                .where(Account._bank_id == self._id,
+                       Account._latest_date.is_not(None),
+                       Account._latest_date <= month_end,
+                       or_(Account._latest_exempt_date.is_(None), Account._latest_exempt_date < month_start))
+                .order_by(Account._account_number)
+            ).all()
+            new_transactions = []
+            new_balances = []
+            new_checkpoints = []
+            posted = []
+            for acct_id, acct_num, acct_type, balance, version in rows:
+                postings = account_classes[acct_type]._month_end_postings(balance, interest.get(acct_num))
+                new_transactions.extend({"_account_id": acct_id, "_amt": amt, "_date": month_end, "_exempt": True}
+                                        for amt in postings)
+                new_balances.append({"b_id": acct_id, "b_version": version, "b_balance": balance + sum(postings)})
+                new_checkpoints.append({"_account_id": acct_id, "_balance_cents": balance + sum(postings)})
+                posted.append((acct_num, postings))
+            if new_balances:
+                if session.execute(update_balances, new_balances).rowcount != len(new_balances):
+                    raise StaleDataError("an account changed during month end")
+                session.execute(insert(Transaction), new_transactions)
+                session.execute(save_checkpoints, new_checkpoints)
+            return posted
+
+        posted = commit_with_retry(session, stage)
+        for acct_num, postings in posted:
+            for amt in postings:
+                audit_transaction(acct_num, amt, month_end, True)
+        logging.info("Ran month end for %d-%02d on %d accounts", month_start.year, month_start.month, len(posted))
+        return posted
+
+    def reconcile(self, session, fix=False) -> list[tuple[int, Decimal, Decimal]]:
+        """Recomputes every account balance from its transactions and compares it with the stored running balance.
+
+        Args:
+            fix (bool, optional): Overwrites drifted balances with the ledger total, rebuilds those accounts' checkpoints
+                and commits. Defaults to False.
+
+        Returns:
+            list[tuple[int, Decimal, Decimal]]: (account number, stored balance, ledger balance) for each account that has drifted
+        """
+        # exact, since amounts are stored as integer cents
+        ledger_total = func.coalesce(func.sum(Transaction._amt), 0)
+        rows = session.execute(
+            select(Account, ledger_total)
+            .outerjoin(Transaction, Transaction._account_id == Account._id)
+            .where(Account._bank_id == self._id)
+            .group_by(Account._id)
+            .order_by(Account._account_number)
+        )
+        cent = Decimal("0.01")
+        drift = []
+        drifted_ids = []
+        for account, total in rows:
+            total = Decimal(total)
+            if account._balance.quantize(cent) != total.quantize(cent):
+                drift.append((account.account_number, account._balance, total))
+                if fix:
+                    account._balance = total
+                    drifted_ids.append(account._id)
+        if drift and fix:
+            # the monthly closing balances were built from the same drifted running totals
+            rebuild_checkpoints(session, drifted_ids)
+            logging.info("Reconciled %d account balances", len(drift))
+            session.commit()
+        return drift
+
+    def transaction_counts(self, session, period_type, day) -> list[tuple[int, int]]:
+        """Reports how many non-exempt transactions each account had in a day or month, read from the transaction counters.
+
+        Args:
+            period_type (str): "day" or "month"
+            day (Date): any date in the period
+
+        Returns:
+            list[tuple[int, int]]: (account number, number of transactions) for each account with transactions in the period
+        """
+        rows = session.execute(
+            select(Account._account_number, TransactionCounter._count)
+            .join(TransactionCounter, TransactionCounter._account_id == Account._id)
+            .where(Account._bank_id == self._id,
+                   TransactionCounter._period_type == period_type,
+                   TransactionCounter._period == period_start(period_type, day))
+            .order_by(Account._account_number)
+        )
+        return [tuple(row) for row in rows]
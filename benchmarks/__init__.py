@@ -0,0 +1,10 @@
+"""Benchmarks for the ledger hot paths on generated banks.
+
+Run from the repository root, for example:
+
+    python -m benchmarks --accounts 100,1000 --transactions 10,100 --out results.json
+
+and for the process startup time of one-shot commands:
+
+    python -m benchmarks --startup --accounts 100 --transactions 10 --repeat 10
+"""
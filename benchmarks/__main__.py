@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+from datetime import datetime
+
+import sqlalchemy
+
+from database import make_engine
+from benchmarks.generate import generate_bank
+from benchmarks.hot_paths import run_hot_paths
+from benchmarks.startup import run_startup
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(",")]
+
+
+def _summarize(timings) -> dict:
+    "Statistics in microseconds for one operation"
+    ordered = sorted(timings)
+    return {
+        "runs": len(ordered),
+        "min_us": ordered[0] * 1e6,
+        "median_us": statistics.median(ordered) * 1e6,
+        "mean_us": statistics.fmean(ordered) * 1e6,
+        "p95_us": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1e6,
+    }
+
+
+def _report(repeat, seed, results) -> dict:
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "repeat": repeat,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def run_startup_benchmark(accounts, transactions, repeat, seed) -> dict:
+    """Times cold starts of one-shot commands against a generated bank.db for every scale."""
+    results = []
+    for num_accounts in accounts:
+        for num_transactions in transactions:
+            with tempfile.TemporaryDirectory() as tmp:
+                timings = run_startup(tmp, num_accounts, num_transactions, repeat, seed)
+            for command, command_timings in timings.items():
+                results.append({"db": "file", "accounts": num_accounts,
+                                "transactions_per_account": num_transactions,
+                                "operation": f"startup: {command}", **_summarize(command_timings)})
+                print(f"startup {num_accounts:>8} x {num_transactions:<6} {command:28} "
+                      f"median {results[-1]['median_us'] / 1e3:10.1f} ms", file=sys.stderr)
+    return _report(repeat, seed, results)
+
+
+def run(accounts, transactions, databases, repeat, seed) -> dict:
+    """Generates a bank for every combination of scale and database and times the hot paths on it."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for db in databases:
+            for num_accounts in accounts:
+                for num_transactions in transactions:
+                    if db == "file":
+                        path = os.path.join(tmp, f"bench_{num_accounts}_{num_transactions}.db")
+                        engine = make_engine("batch", url=f"sqlite:///{path}", echo=False)
+                    else:
+                        engine = make_engine("batch", url="sqlite://", echo=False)
+                    bank_id = generate_bank(engine, num_accounts, num_transactions, seed=seed)
+                    for operation, timings in run_hot_paths(engine, bank_id, repeat, seed).items():
+                        results.append({"db": db, "accounts": num_accounts,
+                                        "transactions_per_account": num_transactions,
+                                        "operation": operation, **_summarize(timings)})
+                        print(f"{db:6} {num_accounts:>8} x {num_transactions:<6} {operation:28} "
+                              f"median {results[-1]['median_us']:10.1f} us", file=sys.stderr)
+                    engine.dispose()
+    return _report(repeat, seed, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Time the ledger hot paths on generated banks")
+    parser.add_argument("--accounts", type=_int_list, default=[100, 1000],
+                        help="comma-separated numbers of accounts (default 100,1000)")
+    parser.add_argument("--transactions", type=_int_list, default=[10, 100],
+                        help="comma-separated transactions per account (default 10,100)")
+    parser.add_argument("--db", default="file,memory",
+                        help="comma-separated databases to run against: file, memory (default both)")
+    parser.add_argument("--repeat", type=int, default=50, help="timed calls per operation (default 50)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the generated data")
+    parser.add_argument("--out", help="write the JSON results here instead of stdout")
+    parser.add_argument("--startup", action="store_true",
+                        help="time cold starts of one-shot cli.py commands (and a headless gui import) instead of the hot paths")
+    args = parser.parse_args()
+
+    if args.startup:
+        report = run_startup_benchmark(args.accounts, args.transactions, args.repeat, args.seed)
+    else:
+        report = run(args.accounts, args.transactions, args.db.split(","), args.repeat, args.seed)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
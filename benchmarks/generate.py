@@ -0,0 +1,69 @@
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+import schema
+from bank import Bank, SAVINGS, CHECKING
+from accounts import Account
+from transactions import Transaction
+
+# rows per bulk insert
+CHUNK_SIZE = 10000
+
+
+def generate_bank(engine, accounts=100, transactions=100, savings_share=0.5,
+                  years=3, start=datetime(2020, 1, 1), seed=0) -> int:
+    """Fills an empty database with a bank of synthetic accounts and transaction histories.
+
+    The rows are bulk inserted rather than going through add_transaction, so histories
+    don't follow the savings limits, but every account opens with a large deposit and
+    deposits outweigh withdrawals, so balances stay positive. Balances, latest dates and counters are then
+    derived from the transactions the same way schema.upgrade backfills an old database.
+
+    Args:
+        accounts (int, optional): number of accounts. Defaults to 100.
+        transactions (int, optional): transactions per account. Defaults to 100.
+        savings_share (float, optional): fraction of savings accounts, the rest are checking. Defaults to 0.5.
+        years (int, optional): the transactions are spread over this many years from start. Defaults to 3.
+        seed (int, optional): random seed, so runs are comparable. Defaults to 0.
+
+    Returns:
+        int: id of the new bank
+    """
+    schema.ensure_current(engine)
+    rng = random.Random(seed)
+    days = 365 * years
+    with Session(engine) as session:
+        bank = Bank()
+        session.add(bank)
+        session.commit()
+        bank_id = bank._id
+
+        session.execute(insert(Account), [
+            {"_id": num, "_bank_id": bank_id, "_account_number": num,
+             "_account_type": SAVINGS if rng.random() < savings_share else CHECKING,
+             "_balance": Decimal(0), "_version": 1}
+            for num in range(1, accounts + 1)
+        ])
+        rows = []
+        for acct_id in range(1, accounts + 1):
+            offsets = sorted(rng.randrange(days) for _ in range(transactions))
+            for i, offset in enumerate(offsets):
+                if i == 0:
+                    amt = Decimal(rng.randrange(100000, 500000)) / 100
+                else:
+                    amt = Decimal(rng.randrange(-2000, 10000)) / 100
+                rows.append({"_account_id": acct_id, "_amt": amt,
+                             "_date": start + timedelta(days=offset), "_exempt": False})
+            if len(rows) >= CHUNK_SIZE:
+                session.execute(insert(Transaction), rows)
+                rows = []
+        if rows:
+            session.execute(insert(Transaction), rows)
+        for _, _, sql in schema.DERIVED:
+            session.execute(text(sql))
+        session.commit()
+    return bank_id
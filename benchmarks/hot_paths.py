@@ -0,0 +1,98 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import sessionmaker
+
+from bank import Bank, CHECKING, SAVINGS
+from accounts import Account
+from transactions import Transaction
+from pipeline import WritePipeline, MAX_BATCH
+
+
+def _timed(func, repeat, setup=None) -> list[float]:
+    "Runs setup() untimed and then func() timed, repeat times. Returns the timings in seconds."
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _first_account(session, bank, acct_type) -> Account:
+    return session.scalars(
+        select(Account).where(Account._bank_id == bank._id, Account._account_type == acct_type)
+        .order_by(Account._account_number)
+    ).first()
+
+
+def run_hot_paths(engine, bank_id, repeat=50, seed=0) -> dict[str, list[float]]:
+    """Times the ledger hot paths on an existing bank.
+
+    Args:
+        bank_id (int): bank created by generate_bank
+        repeat (int, optional): timed calls per operation. Defaults to 50.
+
+    Returns:
+        dict[str, list[float]]: timings in seconds for each operation
+    """
+    rng = random.Random(seed)
+    session = sessionmaker(engine)()
+    bank = session.get(Bank, bank_id)
+    checking = _first_account(session, bank, CHECKING)
+    savings = _first_account(session, bank, SAVINGS)
+    results = {}
+    # new transactions go after the generated history, a day apart
+    next_day = [max(a._latest_date for a in (checking, savings) if a is not None) + timedelta(days=1)]
+
+    def advance(days=1):
+        next_day[0] += timedelta(days=days)
+        return next_day[0]
+
+    if checking is not None:
+        results["add_transaction"] = _timed(
+            lambda: checking.add_transaction(session, Decimal("1.00"), advance()), repeat)
+        # read after a commit, when the account has to be refreshed from the database
+        results["get_balance"] = _timed(checking.get_balance, repeat, setup=session.expire_all)
+        # one new month each time, so interest can be assessed again
+        results["assess_interest_and_fees"] = _timed(
+            lambda: checking.assess_interest_and_fees(session), repeat,
+            setup=lambda: checking.add_transaction(session, Decimal("1.00"), advance(32)))
+    if savings is not None:
+        pending = Transaction(Decimal("1.00"), advance())
+        results["_check_limits"] = _timed(
+            lambda: savings._check_limits(session, pending, pending._date), repeat, setup=session.expire_all)
+
+    count = session.scalar(select(Account._account_number).where(Account._bank_id == bank_id)
+                           .order_by(Account._account_number.desc()).limit(1))
+    numbers = [rng.randint(1, count) for _ in range(repeat)]
+    lookups = iter(numbers)
+    results["Bank.get_account"] = _timed(
+        lambda: bank.get_account(next(lookups)), repeat, setup=bank._account_cache.clear)
+    # the same numbers again, now that they are in the bank's cache
+    for num in numbers:
+        bank.get_account(num)
+    lookups = iter(numbers)
+    results["Bank.get_account (cached)"] = _timed(lambda: bank.get_account(next(lookups)), repeat)
+
+    # a full batch of deposits spread over the checking accounts, submitted and waited for
+    checking_numbers = session.scalars(select(Account._account_number).where(
+        Account._bank_id == bank_id, Account._account_type == CHECKING)).all()
+    if checking_numbers:
+        next_day[0] = max(next_day[0], session.scalar(select(func.max(Account._latest_date))
+                                                      .where(Account._bank_id == bank_id)))
+        with WritePipeline(engine, bank_id) as pipeline:
+            def submit_batch():
+                day = advance()
+                futures = [pipeline.submit(checking_numbers[i % len(checking_numbers)], Decimal("1.00"), day)
+                           for i in range(MAX_BATCH)]
+                for future in futures:
+                    future.result()
+            results[f"WritePipeline ({MAX_BATCH} rows)"] = _timed(submit_batch, repeat)
+    session.close()
+    return results
@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+import time
+
+from database import make_engine
+from benchmarks.generate import generate_bank
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# one-shot invocations, run from the directory holding the generated bank.db
+COMMANDS = {
+    "cli.py --help": ["cli.py", "--help"],
+    "cli.py --verify-balances": ["cli.py", "--verify-balances"],
+    "cli.py month-end": ["cli.py", "month-end", "2000-01"],
+    "import gui (headless)": ["-c", "import gui"],
+}
+
+
+def run_startup(work_dir, accounts=100, transactions=10, repeat=10, seed=0) -> dict[str, list[float]]:
+    """Times whole-process runs of one-shot commands, from interpreter start to exit, against a generated bank.db.
+
+    Args:
+        work_dir (str): directory to create bank.db in and run the commands from
+        repeat (int, optional): runs per command. Defaults to 10.
+
+    Returns:
+        dict[str, list[float]]: wall times in seconds for each command
+    """
+    engine = make_engine("batch", url=f"sqlite:///{os.path.join(work_dir, 'bank.db')}", echo=False)
+    generate_bank(engine, accounts, transactions, seed=seed)
+    engine.dispose()
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [_ROOT, os.environ.get("PYTHONPATH")]))}
+    # the first run upgrades the new database and compiles the bytecode, so it isn't timed
+    subprocess.run([sys.executable, os.path.join(_ROOT, "cli.py"), "--verify-balances"],
+                   cwd=work_dir, env=env, capture_output=True, check=True)
+    timings = {}
+    for name, args in COMMANDS.items():
+        if args[0].endswith(".py"):
+            args = [os.path.join(_ROOT, args[0]), *args[1:]]
+        timings[name] = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *args], cwd=work_dir, env=env, capture_output=True)
+            timings[name].append(time.perf_counter() - start)
+    return timings
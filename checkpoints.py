@@ -0,0 +1,51 @@
+from decimal import Decimal
+
+from sqlalchemy import Integer, ForeignKey, Date, bindparam, delete, text
+from sqlalchemy.orm import mapped_column
+
+from bank import Base
+from money import Cents
+
+
+class BalanceCheckpoint(Base):
+    """Closing balance of an account at the end of one month (so far, for the current month).
+    Only months with transactions have a checkpoint. Lets balances as of a past date be read
+    from the nearest checkpoint plus at most one month of transactions.
+    """
+    __tablename__ = "balance_checkpoint"
+    _account_id = mapped_column(Integer, ForeignKey("account._id"), primary_key=True)
+    # first day of the month
+    _month = mapped_column(Date, primary_key=True)
+    _balance = mapped_column("_balance_cents", Cents, nullable=False, default=Decimal(0))
+
+    def __init__(self, account_id, month) -> None:
+        self._account_id = account_id
+        self._month = month
+        self._balance = Decimal(0)
+
+    def get_balance(self) -> Decimal:
+        return self._balance
+
+    def set_balance(self, balance) -> None:
+        self._balance = balance
+
+
+# each month's closing balance is the running total of the monthly net amounts
+_REBUILD = text(
+    "INSERT INTO balance_checkpoint (_account_id, _month, _balance_cents) "
+    "SELECT _account_id, month, SUM(SUM(_amt_cents)) OVER (PARTITION BY _account_id ORDER BY month) "
+    "FROM (SELECT _account_id, date(_date, 'start of month') AS month, _amt_cents FROM \"transaction\" "
+    "WHERE _account_id IN :account_ids) GROUP BY 1, 2"
+).bindparams(bindparam("account_ids", expanding=True))
+
+
+def rebuild_checkpoints(session, account_ids) -> None:
+    """Recomputes the checkpoints of some accounts from their transactions, without committing.
+    Used when their stored totals can't be trusted, e.g. by Bank.reconcile.
+
+    Args:
+        account_ids (list[int]): Account._id of each account
+    """
+    account_ids = list(account_ids)
+    session.execute(delete(BalanceCheckpoint).where(BalanceCheckpoint._account_id.in_(account_ids)))
+    session.execute(_REBUILD, {"account_ids": account_ids})
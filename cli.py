@@ -1,28 +1,25 @@
-import os
 import sys
-import pickle
-from exceptions import OverdrawError, TransactionSequenceError, TransactionLimitError, TransactionDateError
+import argparse
+from exceptions import OverdrawError, TransactionSequenceError, TransactionLimitError, TransactionDateError, AccountNotFoundError, ConcurrentUpdateError
 import logging
+import logsetup
 import calendar
-from sqlalchemy import create_engine, select
-from sqlalchemy.orm import sessionmaker
 from decimal import Decimal, setcontext, BasicContext, InvalidOperation
 from datetime import datetime
 
-from bank import Bank, Base
+import instrumentation
 
-logging.basicConfig(
-    filename='bank.log',
-    format='%(asctime)s|%(levelname)s|%(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    level=logging.DEBUG
-)
+# SQLAlchemy and the models (bank, accounts, schema, ...) take most of the startup time, so they
+# are imported by the code that needs them, after the arguments have been parsed
+
+logsetup.configure_logging('bank.log')
 # context with ROUND_HALF_UP
 setcontext(BasicContext)
 
 class BankCLI:
     """Driver class for a command-line REPL interface to the Bank application"""
     def __init__(self) -> None:
+        from bank import Bank
         self._session = Session()
         self._bank = self._session.get(Bank, 1)
         if self._bank is None:
@@ -40,7 +37,10 @@ class BankCLI:
             "5": self._list_transactions,
             "6": self._monthly_triggers,
             "7": self._quit,
+            "8": self._stats,
         }
+        if instrumentation.ENABLED:
+            self._choices = instrumentation.instrument_choices(self._choices)
 
     def _display_menu(self):
         print(f"""--------------------------------
@@ -52,29 +52,39 @@ Enter command
 4: add transaction
 5: list transactions
 6: interest and fees
-7: quit""")
+7: quit
+8: stats""")
 
     def run(self):
         """Display the menu and respond to choices."""
+        import sqltrace
         while True:
             self._display_menu()
             choice = input(">")
             action = self._choices.get(choice)
             # expecting a digit 1-9
             if action:
-                action()
+                with sqltrace.operation(f"command {choice}"):
+                    action()
             else: 
                 print("{0} is not a valid choice".format(choice))
 
     def _summary(self) -> None:
-        # dependency on Account objects
-        for x in self._bank.show_accounts():
-            print(x)
+        from accounts import summary_line
+        # one query over the stored balances, no Account objects are loaded
+        for row in self._bank.summary(self._session):
+            print(summary_line(*row))
 
     def _quit(self):
         self._session.close()
         sys.exit(0)
 
+    def _stats(self):
+        if not instrumentation.ENABLED:
+            print("Timing is off. Start the program with BANK_STATS=1 or --stats to collect statistics.")
+            return
+        print(instrumentation.format_report())
+
     # check here later
     def _add_transaction(self):
         if (self._selected_account == None): 
@@ -99,15 +109,8 @@ Enter command
         try: 
             self._selected_account.add_transaction(self._session, amount, date)
             self._session.commit()
-        except OverdrawError as e: 
-            print("This transaction could not be completed due to an insufficient account balance.")
-        except TransactionSequenceError as e: 
-            if e.error_type == "balance": 
-                print(f"New transactions must be from {e.latest_date} onward.")
-            elif e.error_type == "interest":
-                print(f"This transaction could not be completed because the account already has a transaction in {e.latest_date}.")
-        except TransactionLimitError as e: 
-            print(f"This transaction could not be completed because this account already has {e.limit} transactions in this {e.limit_type}.")
+        except (OverdrawError, TransactionSequenceError, TransactionLimitError, ConcurrentUpdateError) as e: 
+            print(_transaction_error_message(e))
 
 
     def _open_account(self):
@@ -129,22 +132,144 @@ Enter command
             print("No transactions have been made on this account yet.")
         except AttributeError as e: 
             print("This command requires that you first select an account.")
+        except ConcurrentUpdateError as e:
+            print(_transaction_error_message(e))
         self._session.commit()
 
     def _list_transactions(self):
         try: 
-            for t in self._selected_account.get_transactions():
+            for t in self._selected_account.iter_transactions(self._session):
                 print(t)
         except AttributeError as e: 
             print("This command requires that you first select an account.")
 
 
+def _transaction_error_message(e) -> str:
+    "Explains why a transaction was rejected"
+    if isinstance(e, OverdrawError):
+        return "This transaction could not be completed due to an insufficient account balance."
+    if isinstance(e, TransactionSequenceError):
+        if e.error_type == "interest":
+            return f"This transaction could not be completed because the account already has a transaction in {e.latest_date}."
+        return f"New transactions must be from {e.latest_date} onward."
+    if isinstance(e, TransactionLimitError):
+        return f"This transaction could not be completed because this account already has {e.limit} transactions in this {e.limit_type}."
+    if isinstance(e, AccountNotFoundError):
+        return f"There is no account #{e.account_number:09}."
+    if isinstance(e, ConcurrentUpdateError):
+        return "This transaction could not be completed because the account is busy. Please try again."
+    return type(e).__name__
+
+
+def _load_bank(session):
+    "Returns the bank, or None if it hasn't been created yet"
+    from bank import Bank
+    return session.get(Bank, 1)
+
+
+def _import_transactions(session, path) -> int:
+    """Loads a CSV/JSONL file of transactions in one batch and prints the rejected rows. Returns the exit status."""
+    import loader
+    try:
+        rows = list(loader.read_transactions(path))
+    except (OSError, ValueError) as e:
+        print(f"Could not read {path}: {e}")
+        return 1
+    bank = _load_bank(session)
+    if bank is None:
+        print("The bank has no accounts yet.")
+        return 1
+    results = bank.import_transactions(session, rows)
+    for result in results:
+        if not result.accepted:
+            print(f"row {result.row + 1}: {_transaction_error_message(result.error)}")
+    accepted = sum(result.accepted for result in results)
+    print(f"Imported {accepted} of {len(results)} transactions.")
+    return 0 if accepted == len(results) else 2
+
+
+def _month(text):
+    "argparse type for YYYY-MM months"
+    try:
+        return datetime.strptime(text, "%Y-%m").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid month {text!r}, expected YYYY-MM")
+
+
+def _run_month_end(session, month, interest_method) -> int:
+    """Posts interest and fees for every account for the month. Returns the exit status."""
+    bank = _load_bank(session)
+    posted = bank.run_month_end(session, month, interest_method) if bank else []
+    print(f"Applied interest and fees for {calendar.month_name[month.month]} {month.year} to {len(posted)} account(s).")
+    return 0
+
+
+def _write_statements(session, month, out_dir, fmt, workers) -> int:
+    """Writes every account's statement for the month to out_dir. Returns the exit status."""
+    import statements
+    bank = _load_bank(session)
+    written = statements.write_statements(session, bank, month, out_dir, fmt, workers) if bank else 0
+    print(f"Wrote {written} statement(s) for {calendar.month_name[month.month]} {month.year} to {out_dir}.")
+    return 0
+
+
+def _verify_balances(session) -> int:
+    """Reports any account whose stored balance has drifted from its transactions. Returns the exit status."""
+    bank = _load_bank(session)
+    drift = bank.reconcile(session) if bank else []
+    for acct_num, stored, ledger in drift:
+        print(f"#{acct_num:09}: stored balance ${stored:,.2f}, ledger balance ${ledger:,.2f}")
+    print(f"{len(drift)} account(s) with balance drift.")
+    return 1 if drift else 0
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Command-line interface to the Bank application")
+    parser.add_argument("--verify-balances", action="store_true",
+                        help="recompute balances from the transactions, report any drift and exit")
+    commands = parser.add_subparsers(dest="command")
+    import_parser = commands.add_parser("import", help="add a CSV or JSONL file of transactions in one batch")
+    import_parser.add_argument("path", help="file with account, amount, date and optional exempt columns")
+    month_end_parser = commands.add_parser("month-end", help="apply interest and fees to every account for a month")
+    month_end_parser.add_argument("month", type=_month, help="month to close, as YYYY-MM")
+    month_end_parser.add_argument("--interest", choices=("flat", "average-daily"), default="flat",
+                                  help="pay interest on the closing balance (flat, the default) or on the average daily balance")
+    statements_parser = commands.add_parser("statements", help="write a statement file for every account for a month")
+    statements_parser.add_argument("--month", type=_month, required=True, help="statement month, as YYYY-MM")
+    statements_parser.add_argument("--out", default="statements", help="directory for the statement files (default: statements)")
+    statements_parser.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    statements_parser.add_argument("--workers", type=int, default=1,
+                                   help="processes to write the statements with (default: 1)")
+    parser.add_argument("--stats", action="store_true",
+                        help=f"time commands and bank operations, and write the statistics to {instrumentation.DUMP_PATH} at exit")
+    args = parser.parse_args()
+    if args.stats or instrumentation.ENABLED:
+        instrumentation.enable()
+
     # Run the CLI - if an exception occurs, log it and print a message to the user
     #try: 
-    engine = create_engine('sqlite:///bank.db')
-    Base.metadata.create_all(engine)
+    from sqlalchemy.orm import sessionmaker
+    from database import make_engine
+    import schema
+    import sqltrace
+    engine = make_engine('cli')
+    # a single query unless the models have changed since the database was last upgraded
+    schema.ensure_current(engine)
+    if sqltrace.ENABLED:
+        sqltrace.trace(engine)
     Session = sessionmaker(engine)
+    if args.verify_balances:
+        with Session() as session:
+            sys.exit(_verify_balances(session))
+    if args.command == "import":
+        with Session() as session:
+            sys.exit(_import_transactions(session, args.path))
+    if args.command == "month-end":
+        with Session() as session:
+            sys.exit(_run_month_end(session, args.month, args.interest))
+    if args.command == "statements":
+        with Session() as session:
+            sys.exit(_write_statements(session, args.month, args.out, args.format, args.workers))
     BankCLI().run()
     #except Exception as e: 
     #    logging.error(f"{type(e).__name__}: {e}")
@@ -0,0 +1,36 @@
+from sqlalchemy import Integer, String, ForeignKey, Date
+from sqlalchemy.orm import mapped_column
+
+from bank import Base
+
+DAY = "day"
+MONTH = "month"
+
+
+class TransactionCounter(Base):
+    """Number of non-exempt transactions an account has in one day or one month.
+    Keeps the savings limit checks (and reports) to a single primary key lookup instead of a scan over the transactions.
+    """
+    __tablename__ = "transaction_counter"
+    _account_id = mapped_column(Integer, ForeignKey("account._id"), primary_key=True)
+    _period_type = mapped_column(String, primary_key=True)
+    # the day itself, or the first day of the month
+    _period = mapped_column(Date, primary_key=True)
+    _count = mapped_column(Integer, nullable=False, default=0)
+
+    def __init__(self, account_id, period_type, period) -> None:
+        self._account_id = account_id
+        self._period_type = period_type
+        self._period = period
+        self._count = 0
+
+    def get_count(self) -> int:
+        return self._count
+
+    def increment(self) -> None:
+        self._count += 1
+
+
+def period_start(period_type, day):
+    "Returns the key for the day or month containing the given date"
+    return day if period_type == DAY else day.replace(day=1)
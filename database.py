@@ -0,0 +1,96 @@
+import configparser
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+
+# Settings for every front end. They can be overridden, in increasing order of priority, by
+# the [database] section of the config file (bank.ini, or the file named by $BANK_CONFIG) and
+# BANK_DB_<SETTING> environment variables, e.g. BANK_DB_SYNCHRONOUS=FULL, which apply to every
+# front end; then the defaults a front end passes to make_engine, e.g. the notebook's url; then
+# the section named after the front end and BANK_DB_<FRONT END>_<SETTING>, e.g. BANK_DB_NOTEBOOK_URL.
+DEFAULTS = {
+    "url": "sqlite:///bank.db",
+    "echo": "false",
+    # readers don't block the writer (or each other) with a write-ahead log
+    "journal_mode": "WAL",
+    # in WAL mode NORMAL only syncs at checkpoints, and a crash can't corrupt the database
+    "synchronous": "NORMAL",
+    # negative values are in KiB, so this is a 64MB page cache
+    "cache_size": "-64000",
+    "mmap_size": str(256 * 1024 * 1024),
+    # milliseconds to wait for another process's write lock before failing
+    "busy_timeout": "5000",
+}
+
+# connection pool sizes for each front end
+POOLS = {
+    # a single session for the whole run
+    "cli": {"pool_size": "1", "max_overflow": "1"},
+    "notebook": {"pool_size": "1", "max_overflow": "0"},
+    # the window's session, plus short-lived ones for background work
+    "gui": {"pool_size": "1", "max_overflow": "2"},
+    # worker threads and processes for imports, statements and benchmarks
+    "batch": {"pool_size": "5", "max_overflow": "10"},
+}
+
+_PRAGMAS = ("journal_mode", "synchronous", "cache_size", "mmap_size", "busy_timeout")
+
+
+def load_settings(front_end="cli", **defaults) -> dict[str, str]:
+    """Collects the engine settings for a front end from DEFAULTS, POOLS, the config file, the environment and the given defaults,
+    in the order described above DEFAULTS.
+
+    Args:
+        front_end (str, optional): "cli", "gui", "notebook" or "batch". Defaults to "cli".
+        defaults: settings that replace DEFAULTS for this front end, e.g. url="sqlite:///notebook.db"
+    """
+    settings = {**DEFAULTS, **POOLS.get(front_end, {})}
+    config = configparser.ConfigParser()
+    config.read(os.environ.get("BANK_CONFIG", "bank.ini"))
+    _override(settings, config, "database", "BANK_DB_")
+    # after the shared overrides, so that e.g. BANK_DB_URL doesn't send the notebook to bank.db
+    settings.update({k: str(v) for k, v in defaults.items()})
+    _override(settings, config, front_end, f"BANK_DB_{front_end.upper()}_")
+    return settings
+
+
+def _override(settings, config, section, env_prefix) -> None:
+    "Applies a config file section and then the environment variables named env_prefix + the setting in capitals"
+    if config.has_section(section):
+        settings.update(config.items(section))
+    for key in list(settings):
+        env_value = os.environ.get(f"{env_prefix}{key.upper()}")
+        if env_value is not None:
+            settings[key] = env_value
+
+
+def make_engine(front_end="cli", **defaults):
+    """Creates an engine with the settings from load_settings. For SQLite files the pragmas are set on every new connection.
+    """
+    settings = load_settings(front_end, **defaults)
+    url = settings["url"]
+    options = {"echo": settings["echo"].lower() in ("1", "true", "yes")}
+    in_memory = url in ("sqlite://", "sqlite:///:memory:")
+    if in_memory:
+        # every connection to sqlite:// would otherwise get its own empty database, so all threads share one
+        options["poolclass"] = StaticPool
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        options["pool_size"] = int(settings["pool_size"])
+        options["max_overflow"] = int(settings["max_overflow"])
+    engine = create_engine(url, **options)
+
+    if engine.dialect.name == "sqlite":
+        pragmas = [(name, settings[name]) for name in _PRAGMAS if settings.get(name)]
+        if in_memory:
+            pragmas = [(name, value) for name, value in pragmas if name != "journal_mode"]
+
+        @event.listens_for(engine, "connect")
+        def _set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    return engine
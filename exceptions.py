@@ -24,3 +24,27 @@ class TransactionDateError(Exception):
     def __init__(self):
         super().__init__()
 
+
+
+class AccountNotFoundError(Exception):
+    """Raised when a transaction refers to an account number the bank does not have"""
+    def __init__(self, account_number):
+        super().__init__()
+        self.account_number = account_number
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when another writer kept changing an account while a transaction was being retried"""
+    def __init__(self, attempts):
+        super().__init__()
+        self.attempts = attempts
+
+
+class JournalReplayError(Exception):
+    """Raised when the account rules reject a journaled transaction as it is applied to the database.
+    The transaction was already acknowledged, so the journal is left unapplied from that record on.
+    """
+    def __init__(self, account_number, error):
+        super().__init__(account_number, error)
+        self.account_number = account_number
+        self.error = error
@@ -1,29 +1,28 @@
-import os
 import sys
-import pickle
 from exceptions import OverdrawError, TransactionSequenceError, TransactionLimitError, TransactionDateError
 import logging
+import logsetup
 import calendar
-from sqlalchemy import create_engine, select
 from sqlalchemy.orm import sessionmaker
 from decimal import Decimal, setcontext, BasicContext, InvalidOperation
 from datetime import datetime
-import tkinter as tk
-from tkinter import messagebox
 from bank import Bank, Base
+from accounts import summary_line
+import schema
+import instrumentation
+from database import make_engine
 
-logging.basicConfig(
-    filename='bank.log',
-    format='%(asctime)s|%(levelname)s|%(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    level=logging.DEBUG
-)
+logsetup.configure_logging('bank.log')
 # context with ROUND_HALF_UP
 setcontext(BasicContext)
 
 class BankCLI:
     """Driver class for a command-line REPL interface to the Bank application"""
     def __init__(self) -> None:
+        # tkinter is only loaded once a window is opened, so importing this module works without a display
+        global tk, messagebox
+        import tkinter as tk
+        from tkinter import messagebox
         self._window = tk.Tk()
         self._window.title("Bank Application")
         self._options_frame = tk.Frame(self._window)
@@ -48,10 +47,10 @@ class BankCLI:
 
 
     def _summary(self) -> None:
-        # dependency on Account objects
+        # one query over the stored balances, no Account objects are loaded
         row = 0
-        for x in self._bank.show_accounts():
-            tk.Label(self._list_frame, text=x).grid(row=row, column=0)
+        for summary_row in self._bank.summary(self._session):
+            tk.Label(self._list_frame, text=summary_line(*summary_row)).grid(row=row, column=0)
             row += 1
 
     def _quit(self):
@@ -191,8 +190,10 @@ class BankCLI:
 if __name__ == "__main__":
     # Run the CLI - if an exception occurs, log it and print a message to the user
     #try: 
-    engine = create_engine('sqlite:///bank.db')
-    Base.metadata.create_all(engine)
+    engine = make_engine('gui')
+    schema.ensure_current(engine)
+    if instrumentation.ENABLED:
+        instrumentation.enable()
     Session = sessionmaker(engine)
     BankCLI()
     #except Exception as e: 
@@ -0,0 +1,145 @@
+import atexit
+import functools
+import inspect
+import json
+import math
+import os
+import threading
+import time
+
+# Timing is off unless BANK_STATS is set (or enable() is called). When it is off nothing is
+# wrapped, so the instrumented methods run exactly as written.
+ENABLED = os.environ.get("BANK_STATS", "").lower() not in ("", "0", "false", "no")
+DUMP_PATH = os.environ.get("BANK_STATS_FILE", "bank_stats.json")
+
+
+class Histogram:
+    """Log-bucketed histogram of durations. Each bucket is 5% wider than the last,
+    so percentiles are accurate to within about 5% using a bounded amount of memory.
+    """
+    _GROWTH = 1.05
+    # bucket 0 holds everything under a microsecond
+    _SMALLEST = 1e-6
+
+    def __init__(self) -> None:
+        self._buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds) -> None:
+        "Adds one duration, in seconds"
+        if seconds <= self._SMALLEST:
+            bucket = 0
+        else:
+            bucket = int(math.log(seconds / self._SMALLEST, self._GROWTH)) + 1
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p) -> float:
+        """Returns the upper edge of the bucket holding the p-th percentile, in seconds
+
+        Args:
+            p (float): percentile between 0 and 100
+        """
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                return min(self.max, self._SMALLEST * self._GROWTH ** bucket)
+        return self.max
+
+
+_histograms = {}
+_lock = threading.Lock()
+_installed = False
+
+
+def record(name, seconds) -> None:
+    "Adds a duration to the named histogram"
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.record(seconds)
+
+
+def timed(name, func):
+    "Wraps func so every call's wall time is recorded under name, including calls that raise"
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(name, time.perf_counter() - start)
+    return wrapper
+
+
+def instrument_class(cls) -> None:
+    """Times every public method defined directly on cls. Generator methods are skipped,
+    since calling them only creates the generator.
+    """
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith("_") or not inspect.isfunction(value) or inspect.isgeneratorfunction(value):
+            continue
+        setattr(cls, attr, timed(f"{cls.__name__}.{attr}", value))
+
+
+def instrument_choices(choices) -> dict:
+    "Returns a copy of a menu's choice -> handler dict with every handler timed"
+    return {key: timed(f"command {key} ({handler.__name__.lstrip('_')})", handler)
+            for key, handler in choices.items()}
+
+
+def enable(dump_path=DUMP_PATH) -> None:
+    """Times the public Bank and Account methods from now on, and writes the statistics to dump_path at exit.
+    """
+    global ENABLED, _installed
+    ENABLED = True
+    if _installed:
+        return
+    _installed = True
+    from bank import Bank
+    from accounts import Account
+    instrument_class(Bank)
+    instrument_class(Account)
+    if dump_path:
+        atexit.register(dump, dump_path)
+
+
+def report() -> list[dict]:
+    """Returns call counts and p50/p95/p99/max wall times in milliseconds for each timed operation, slowest total first.
+    """
+    with _lock:
+        items = list(_histograms.items())
+    rows = [{
+        "operation": name,
+        "calls": h.count,
+        "total_ms": h.total * 1e3,
+        "p50_ms": h.percentile(50) * 1e3,
+        "p95_ms": h.percentile(95) * 1e3,
+        "p99_ms": h.percentile(99) * 1e3,
+        "max_ms": h.max * 1e3,
+    } for name, h in items]
+    return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+
+def format_report() -> str:
+    "Formats report() as a table"
+    lines = [f"{'operation':40} {'calls':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+    for row in report():
+        lines.append(f"{row['operation']:40} {row['calls']:>7} {row['p50_ms']:>9.3f} "
+                     f"{row['p95_ms']:>9.3f} {row['p99_ms']:>9.3f} {row['max_ms']:>9.3f}")
+    return "\n".join(lines)
+
+
+def dump(path=DUMP_PATH) -> None:
+    "Writes report() to a JSON file"
+    with open(path, "w") as f:
+        json.dump(report(), f, indent=2)
@@ -0,0 +1,85 @@
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import select, type_coerce, Integer
+
+from accounts import Account
+from ledger import Ledger
+from money import from_cents
+
+
+def daily_balance_totals(ledger, closing, month_start, month_end) -> np.ndarray:
+    """Sum of each account's end-of-day balances over the days of a month, in cent-days, worked out
+    backwards from the closing balances. A transaction on day d isn't in the balance on the days of the
+    month before d, so the total is closing * days in the month, less amount * (d - month_start) for each transaction.
+
+    Args:
+        ledger (Ledger): the accounts' transactions in the month, and no others
+        closing (np.ndarray): int64 balance in cents at the end of the month for each of ledger.account_numbers
+        month_start (Date): first day of the month
+        month_end (Date): last day of the month
+
+    Returns:
+        np.ndarray: int64 total for each of ledger.account_numbers
+    """
+    days = month_end.toordinal() - month_start.toordinal() + 1
+    missing_days = ledger.cents * (ledger.days.astype(np.int64) - month_start.toordinal())
+    return closing * days - ledger.sum_by_account(missing_days)
+
+
+def interest_cents(totals, days, rate) -> np.ndarray:
+    """Interest on average daily balances at a monthly rate, rounded to the cent half up like round_cents.
+    Integer arithmetic throughout, so the result is exact.
+
+    Args:
+        totals (np.ndarray): int64 daily balance totals in cent-days, from daily_balance_totals
+        days (int): days in the month
+        rate (Decimal): monthly interest rate, e.g. SavingsAccount._interest_rate
+
+    Returns:
+        np.ndarray: int64 interest in cents for each total
+    """
+    numerator, denominator = rate.as_integer_ratio()
+    scaled = totals * numerator
+    divisor = denominator * days
+    return np.sign(scaled) * ((np.abs(scaled) * 2 + divisor) // (2 * divisor))
+
+
+def average_daily_interest(session, bank, month_start, month_end, rates) -> dict[int, Decimal]:
+    """Works out interest on the average daily balance for the month for every account in the bank at once.
+    Accounts with transactions after month_end get no result, since their stored balance isn't the month's closing balance.
+
+    Args:
+        month_start (Date): first day of the month
+        month_end (Date): last day of the month
+        rates (dict): monthly interest rate (Decimal) for each account type, e.g. {"savings": Decimal("0.0033")}
+
+    Returns:
+        dict[int, Decimal]: interest for each account number
+    """
+    ledger = Ledger.for_bank(session, bank, month_start, month_end)
+    rows = session.execute(
+        select(Account._account_number, Account._account_type, type_coerce(Account._balance, Integer))
+        .where(Account._bank_id == bank._id,
+               Account._latest_date.is_not(None),
+               Account._latest_date <= month_end)
+    ).all()
+    if not rows:
+        return {}
+    numbers = np.fromiter((row[0] for row in rows), np.int64, len(rows))
+    types = np.array([row[1] for row in rows])
+    closing = np.fromiter((row[2] for row in rows), np.int64, len(rows))
+
+    # line the stored balances up with the ledger's accounts
+    order = np.argsort(ledger.account_numbers)
+    position = order[np.searchsorted(ledger.account_numbers, numbers, sorter=order)]
+    ledger_closing = np.zeros(len(ledger.account_numbers), np.int64)
+    ledger_closing[position] = closing
+    totals = daily_balance_totals(ledger, ledger_closing, month_start, month_end)[position]
+
+    days = month_end.toordinal() - month_start.toordinal() + 1
+    cents = np.zeros(len(rows), np.int64)
+    for account_type, rate in rates.items():
+        selected = types == account_type
+        cents[selected] = interest_cents(totals[selected], days, rate)
+    return {number: from_cents(amount) for number, amount in zip(numbers.tolist(), cents.tolist())}
@@ -0,0 +1,269 @@
+import logging
+import os
+import struct
+import zlib
+from datetime import date
+
+from sqlalchemy import Integer, String
+from sqlalchemy.orm import mapped_column
+from sqlalchemy.orm.exc import StaleDataError
+
+from bank import Base
+from accounts import commit_with_retry, audit_transaction
+from exceptions import JournalReplayError
+from money import to_cents, from_cents
+from pipeline import WritePipeline, MAX_BATCH, MAX_DELAY
+
+MAGIC = b"BANKJRN1"
+# account number, amount in cents, date.toordinal() and exempt flag, followed by a CRC32 of those bytes
+_RECORD = struct.Struct("<qqi?")
+_CRC = struct.Struct("<I")
+RECORD_SIZE = _RECORD.size + _CRC.size
+
+
+class JournalOffset(Base):
+    """How far into a journal file has been applied to the database.
+    Updated in the same commit as the transactions it covers, so each record is applied exactly once.
+    """
+    __tablename__ = "journal_offset"
+    # the journal's file name
+    _journal = mapped_column(String, primary_key=True)
+    _offset = mapped_column(Integer, nullable=False)
+
+    def __init__(self, journal, offset) -> None:
+        self._journal = journal
+        self._offset = offset
+
+
+class Journal:
+    """Append-only file of accepted transactions, made durable with one fsync per append.
+    Records are fixed size, so any byte offset at a record boundary can be used as a position in the journal.
+    A record cut short or corrupted by a crash fails its checksum and ends the journal there.
+    """
+    def __init__(self, path) -> None:
+        self.path = path
+        self.name = os.path.basename(path)
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+            self._sync()
+            if os.name == "posix":
+                # makes the new file's directory entry durable too
+                directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+                try:
+                    os.fsync(directory)
+                finally:
+                    os.close(directory)
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                self._file.close()
+                raise ValueError(f"{path} is not a transaction journal")
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    @property
+    def end(self) -> int:
+        "Offset just past the last byte written"
+        return self._file.tell()
+
+    def append(self, rows) -> int:
+        """Writes transactions to the end of the journal and waits until they are on disk.
+
+        Args:
+            rows (iterable): (account number, amount, date, exempt) tuples
+
+        Returns:
+            int: offset just past the new records
+        """
+        chunks = []
+        for acct_num, amt, day, exempt in rows:
+            record = _RECORD.pack(acct_num, to_cents(amt), day.toordinal(), bool(exempt))
+            chunks.append(record + _CRC.pack(zlib.crc32(record)))
+        self._file.write(b"".join(chunks))
+        self._sync()
+        return self.end
+
+    def read(self, offset=len(MAGIC)):
+        """Reads the journal from offset, stopping at the end or at the first damaged record.
+
+        Yields:
+            tuple[int, tuple]: offset just past the record, and its (account number, amount, date, exempt)
+        """
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while True:
+                data = f.read(RECORD_SIZE)
+                if len(data) < RECORD_SIZE:
+                    return
+                record, (crc,) = data[:_RECORD.size], _CRC.unpack(data[_RECORD.size:])
+                if zlib.crc32(record) != crc:
+                    return
+                offset += RECORD_SIZE
+                acct_num, cents, ordinal, exempt = _RECORD.unpack(record)
+                yield offset, (acct_num, from_cents(cents), date.fromordinal(ordinal), exempt)
+
+    def truncate(self, offset) -> None:
+        "Drops everything after offset, such as a record torn by a crash"
+        self._file.truncate(offset)
+        self._file.seek(offset)
+        self._sync()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def applied_offset(session, journal) -> int:
+    "Offset up to which the journal has been applied to the database"
+    state = session.get(JournalOffset, journal.name)
+    return state._offset if state is not None else len(MAGIC)
+
+
+def _set_applied_offset(session, journal, offset) -> None:
+    state = session.get(JournalOffset, journal.name)
+    if state is None:
+        session.add(JournalOffset(journal.name, offset))
+    else:
+        state._offset = offset
+
+
+def replay(session, bank, journal, batch_size=MAX_BATCH) -> int:
+    """Applies the journal records after the applied offset to the database, in batches of one commit each,
+    and cuts off a damaged tail left by a crash. Run at startup before anything else writes to the bank.
+
+    Returns:
+        int: number of records replayed
+    """
+    replayed = 0
+    end = offset = applied_offset(session, journal)
+    batch = []
+    for end, row in journal.read(offset):
+        batch.append(row)
+        if len(batch) == batch_size:
+            _apply(session, bank, journal, batch, end)
+            replayed += len(batch)
+            batch = []
+    if batch:
+        _apply(session, bank, journal, batch, end)
+        replayed += len(batch)
+    if journal.end > end:
+        logging.warning("Discarding %d damaged bytes at the end of %s", journal.end - end, journal.path)
+        journal.truncate(end)
+    if replayed:
+        logging.info("Replayed %d journal records from %s", replayed, journal.path)
+    return replayed
+
+
+def _apply(session, bank, journal, rows, end) -> None:
+    """Stages already-accepted rows and commits them with the new applied offset.
+    The rows passed the rules against this same state when they were journaled, so a rejection here
+    means the database was changed by something other than the journal.
+
+    Raises:
+        JournalReplayError: if the rules reject a row. Nothing from the batch is committed and the offset stays put,
+            so an acknowledged transaction is never dropped.
+    """
+    def stage():
+        staged = bank._stage_rows(session, rows)
+        for (acct_num, *_), result in zip(rows, staged):
+            if not result.accepted:
+                session.rollback()
+                raise JournalReplayError(acct_num, result.error)
+        _set_applied_offset(session, journal, end)
+        return staged
+
+    try:
+        commit_with_retry(session, stage)
+    except JournalReplayError as e:
+        logging.error("Journal record for #%09d in %s was rejected when applied: %r",
+                      e.account_number, journal.path, e.error)
+        raise
+    for acct_num, amt, day, exempt in rows:
+        audit_transaction(acct_num, amt, day, exempt)
+
+
+class JournaledPipeline(WritePipeline):
+    """WritePipeline that makes each batch durable by appending its accepted transactions to a Journal before
+    they reach the database. A future resolves as soon as its row is appended and synced. The writer thread then
+    applies the batch to bank.db, and on startup it first replays whatever a crash left unapplied. The journal
+    also serves as a feed of every accepted transaction, in order (see Journal.read).
+
+    The pipeline must be the only writer to the bank's accounts, since rows are checked against the
+    state the writer holds before they are journaled. If another writer changes an account anyway, the batch
+    is replayed from the journal on top of that change, and a row the rules then reject stops the writer
+    with JournalReplayError instead of being dropped.
+    """
+    def __init__(self, engine, path, bank_id=1, max_batch=MAX_BATCH, max_delay=MAX_DELAY) -> None:
+        """
+        Args:
+            path (str): journal file, created if it doesn't exist
+        """
+        super().__init__(engine, bank_id, max_batch, max_delay)
+        self._journal = Journal(path)
+        # whether journaled rows failed to reach the database and have to be replayed before the next batch
+        self._behind = False
+
+    def close(self) -> None:
+        super().close()
+        self._journal.close()
+
+    def _start(self, session, bank) -> None:
+        replay(session, bank, self._journal, self._max_batch)
+
+    def _catch_up(self, session, bank) -> None:
+        "Applies the rows a failed commit left in the journal, so the next batch is checked against them"
+        if self._behind:
+            replay(session, bank, self._journal, self._max_batch)
+            self._behind = False
+
+    def _commit(self, session, bank, batch) -> None:
+        rows = [row for row, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            if bank is None:
+                raise LookupError(f"there is no bank {self._bank_id}")
+            self._catch_up(session, bank)
+            results = bank._stage_rows(session, rows)
+            accepted = [row for row, result in zip(rows, results) if result.accepted]
+            end = self._journal.append(accepted) if accepted else None
+        except JournalReplayError:
+            # the database no longer matches what was acknowledged, so stop rather than build on it
+            session.rollback()
+            raise
+        except Exception as e:
+            logging.exception("Journaled batch of %d transactions failed", len(batch))
+            session.rollback()
+            for future in futures:
+                future.set_exception(e)
+            return
+        # durable from here on, whatever happens to the database commit
+        for row, result, future in zip(rows, results, futures):
+            if result.accepted:
+                future.set_result(None)
+            else:
+                future.set_exception(result.error)
+                audit_transaction(*row, result.error)
+        if end is None:
+            session.rollback()
+            return
+        _set_applied_offset(session, self._journal, end)
+        try:
+            session.commit()
+        except Exception as e:
+            # the rows are already durable in the journal, so they are applied from there instead: straight away
+            # if an account was changed outside the pipeline, or once the database recovers
+            if not isinstance(e, StaleDataError):
+                logging.exception("Committing a journaled batch of %d transactions failed", len(accepted))
+            session.rollback()
+            self._behind = True
+            try:
+                self._catch_up(session, bank)
+            except JournalReplayError:
+                raise
+            except Exception:
+                logging.exception("Replaying %s failed, retrying before the next batch", self._journal.path)
+                session.rollback()
+            return
+        for acct_num, amt, day, exempt in accepted:
+            audit_transaction(acct_num, amt, day, exempt)
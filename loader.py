@@ -0,0 +1,41 @@
+import csv
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+
+def _parse_row(line_num, account, amount, date, exempt=False) -> tuple:
+    """Converts the text fields of one input row to (account number, amount, date, exempt).
+
+    Raises:
+        ValueError: if a field can't be parsed. The message includes the line number.
+    """
+    try:
+        if isinstance(exempt, str):
+            exempt = exempt.strip().lower() in ("1", "true", "yes", "y")
+        return (int(account), Decimal(str(amount)),
+                datetime.strptime(str(date), "%Y-%m-%d").date(), bool(exempt))
+    except (InvalidOperation, ValueError, TypeError) as e:
+        raise ValueError(f"line {line_num}: invalid transaction ({e})") from e
+
+
+def read_transactions(path):
+    """Reads transactions from a CSV file (with an account,amount,date[,exempt] header)
+    or a JSON lines file (one {"account", "amount", "date"[, "exempt"]} object per line).
+    The format is chosen by the file extension (.jsonl or .csv).
+
+    Yields:
+        tuple: (account number, amount, date, exempt) rows for Bank.import_transactions
+    """
+    with open(path, newline="") as f:
+        if path.endswith((".jsonl", ".json")):
+            for line_num, line in enumerate(f, start=1):
+                if line.strip():
+                    record = json.loads(line)
+                    yield _parse_row(line_num, record.get("account"), record.get("amount"),
+                                     record.get("date"), record.get("exempt", False))
+        else:
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield _parse_row(reader.line_num, record.get("account"), record.get("amount"),
+                                 record.get("date"), record.get("exempt") or False)
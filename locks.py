@@ -0,0 +1,35 @@
+import threading
+from contextlib import contextmanager
+
+
+class OrderedLocks:
+    """One lock per key, always acquired in sorted key order. Two threads that each need several keys
+    wait for each other at their first shared key instead of each holding a key the other needs,
+    so they can never deadlock.
+    """
+    def __init__(self) -> None:
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _lock(self, key) -> threading.Lock:
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    @contextmanager
+    def hold(self, keys):
+        "Holds the locks for all of the keys inside the block"
+        locks = [self._lock(key) for key in sorted(set(keys))]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+# per-account locks for the writers in this process, keyed by account number
+account_locks = OrderedLocks()
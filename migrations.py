@@ -0,0 +1,82 @@
+import logging
+from typing import Callable, NamedTuple
+
+from sqlalchemy import Table, Column, Integer, inspect, text
+from sqlalchemy.exc import OperationalError
+
+
+class Migration(NamedTuple):
+    "One numbered step in a database's schema history"
+    version: int
+    description: str
+    # SQL statements, run in one transaction with the version update, or a function that
+    # takes the engine, for changes that depend on what is already in the database
+    apply: tuple[str, ...] | Callable
+
+
+def version_table(metadata) -> Table:
+    "The single-row table holding the version of the last migration applied to a database"
+    if "schema_version" in metadata.tables:
+        return metadata.tables["schema_version"]
+    return Table("schema_version", metadata, Column("version", Integer, nullable=False))
+
+
+def get_version(engine, metadata) -> int | None:
+    "Version of the last migration applied, 0 for a database from before migrations, or None for an empty database"
+    try:
+        with engine.connect() as conn:
+            version = conn.execute(version_table(metadata).select()).scalar()
+    except OperationalError:
+        # no schema_version table
+        version = None
+    if version is None and inspect(engine).get_table_names():
+        return 0
+    return version
+
+
+def _set_version(conn, table, version) -> None:
+    conn.execute(table.delete())
+    conn.execute(table.insert().values(version=version))
+
+
+def migrate(engine, metadata, migrations) -> list[Migration]:
+    """Brings a database up to the last of the migrations, in place.
+    An empty database gets every table and index from the models and is marked as current.
+    An existing one gets the migrations newer than its version, in order, each recorded as it completes.
+    When the database is already current this costs a single query.
+
+    Args:
+        metadata (MetaData): the models' metadata
+        migrations (list[Migration]): the database's history, in increasing version order
+
+    Returns:
+        list[Migration]: the migrations that were applied
+    """
+    latest = migrations[-1].version
+    version = get_version(engine, metadata)
+    if version == latest:
+        return []
+    table = version_table(metadata)
+    if version is None:
+        metadata.create_all(engine)
+        with engine.begin() as conn:
+            _set_version(conn, table, latest)
+        return []
+
+    table.create(engine, checkfirst=True)
+    applied = []
+    for migration in migrations:
+        if migration.version <= version:
+            continue
+        logging.info("Migrating %s to version %d: %s", engine.url.database, migration.version, migration.description)
+        if callable(migration.apply):
+            migration.apply(engine)
+            with engine.begin() as conn:
+                _set_version(conn, table, migration.version)
+        else:
+            with engine.begin() as conn:
+                for statement in migration.apply:
+                    conn.execute(text(statement))
+                _set_version(conn, table, migration.version)
+        applied.append(migration)
+    return applied
@@ -0,0 +1,45 @@
+from decimal import Decimal, Context, ROUND_HALF_UP, MAX_EMAX, MIN_EMIN
+
+from sqlalchemy import Integer
+from sqlalchemy.types import TypeDecorator
+
+CENT = Decimal("0.01")
+# used for every conversion instead of the current context, which the front ends set to BasicContext
+# (9 digits), so amounts of $10M and more are neither rejected nor stripped of their cents
+_CONTEXT = Context(prec=38, rounding=ROUND_HALF_UP, Emax=MAX_EMAX, Emin=MIN_EMIN)
+
+
+def round_cents(amount) -> Decimal:
+    "Rounds a dollar amount to whole cents, half up"
+    if not isinstance(amount, Decimal):
+        amount = Decimal(str(amount))
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP, context=_CONTEXT)
+
+
+def to_cents(amount) -> int:
+    "Converts a dollar amount to a whole number of cents, rounding half up"
+    return int(round_cents(amount).scaleb(2, context=_CONTEXT))
+
+
+def from_cents(cents) -> Decimal:
+    "Converts a whole number of cents to an exact two-place dollar amount"
+    return Decimal(cents).scaleb(-2, context=_CONTEXT)
+
+
+class Cents(TypeDecorator):
+    """Stores Decimal dollar amounts as an integer number of cents.
+    Amounts are rounded to the cent on the way in and come back as exact two-place Decimals,
+    so SQL SUM over these columns is exact integer arithmetic.
+    """
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return to_cents(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return from_cents(value)
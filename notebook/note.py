@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Integer, String, ForeignKey, DateTime
+from sqlalchemy import Integer, String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import mapped_column
 
 from notebook import Base
@@ -17,6 +17,11 @@ class Note(Base):
     _tags = mapped_column(String)
     _creation_date = mapped_column(DateTime)
 
+    # loading a notebook's notes looks them up by notebook
+    __table_args__ = (
+        Index("ix_note_notebook", "_notebook_id"),
+    )
+
     # last_id = 0
 
     def __init__(self, memo, tags=""):
@@ -0,0 +1,157 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy.orm import sessionmaker
+
+from bank import Bank
+
+# a batch is committed once it has this many rows ...
+MAX_BATCH = 500
+# ... or this many seconds after its first row arrived, whichever comes first
+MAX_DELAY = 0.005
+
+_STOP = object()
+
+
+class WritePipeline:
+    """Group commit for transactions on any of a bank's accounts. Callers submit transactions from any thread
+    and get a future back. A writer thread collects them into batches, checks each row against the account
+    rules in submission order and commits the whole batch at once, so many transactions share one commit
+    (and one fsync) instead of paying for their own.
+
+    For example:
+        with WritePipeline(engine) as pipeline:
+            futures = [pipeline.submit(acct_num, amt, date) for acct_num, amt, date in rows]
+            for future in futures:
+                future.result()  # raises OverdrawError etc. for rejected rows
+    """
+    def __init__(self, engine, bank_id=1, max_batch=MAX_BATCH, max_delay=MAX_DELAY) -> None:
+        """
+        Args:
+            bank_id (int, optional): bank whose accounts the transactions are for. Defaults to 1.
+            max_batch (int, optional): most rows per commit. Defaults to MAX_BATCH.
+            max_delay (float, optional): longest a row waits for its batch to fill, in seconds. Defaults to MAX_DELAY.
+        """
+        # the writer keeps its accounts loaded between commits. If another process changes one, the version
+        # check fails at commit and the batch is re-checked against fresh state (see commit_with_retry)
+        self._sessions = sessionmaker(engine, expire_on_commit=False)
+        self._bank_id = bank_id
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        # the error that stopped the writer thread, if it failed. Checked and set under the lock,
+        # so no row can be queued after the writer has drained the queue for the last time
+        self._error = None
+        self._error_lock = threading.Lock()
+
+    def start(self) -> "WritePipeline":
+        self._thread = threading.Thread(target=self._run, name="bank-write-pipeline", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        "Commits everything submitted so far and stops the writer thread"
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "WritePipeline":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def submit(self, account_number, amt, date, exempt=False) -> Future:
+        """Queues a transaction for the next batch.
+
+        Returns:
+            Future: resolves to None once the transaction is committed, or raises the OverdrawError,
+            TransactionSequenceError, TransactionLimitError or AccountNotFoundError that rejected it,
+            or the error that made its batch fail to commit
+        """
+        if self._thread is None:
+            raise RuntimeError("the pipeline isn't running")
+        future = Future()
+        with self._error_lock:
+            if self._error is not None:
+                future.set_exception(self._error)
+            else:
+                self._queue.put(((account_number, amt, date, exempt), future))
+        return future
+
+    def _next_batch(self) -> tuple[list, bool]:
+        "Waits for a row, then collects more until the batch is full or max_delay has passed. Returns the batch and whether to stop."
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self._max_delay
+        while len(batch) < self._max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        batch = []
+        try:
+            with self._sessions() as session:
+                bank = session.get(Bank, self._bank_id)
+                self._start(session, bank)
+                stop = False
+                while not stop:
+                    batch, stop = self._next_batch()
+                    if batch:
+                        self._commit(session, bank, batch)
+                    batch = []
+        except Exception as e:
+            logging.exception("Write pipeline stopped")
+            self._fail(batch, e)
+
+    def _fail(self, batch, error) -> None:
+        "Fails the batch in progress, everything still queued and every later submit with the error that stopped the writer"
+        with self._error_lock:
+            self._error = error
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def _start(self, session, bank) -> None:
+        "Runs on the writer thread before the first batch"
+
+    def _commit(self, session, bank, batch) -> None:
+        futures = [future for _, future in batch]
+        try:
+            if bank is None:
+                raise LookupError(f"there is no bank {self._bank_id}")
+            results = bank.import_transactions(session, [row for row, _ in batch])
+        except Exception as e:
+            logging.exception("Write pipeline batch of %d transactions failed", len(batch))
+            session.rollback()
+            for future in futures:
+                future.set_exception(e)
+            return
+        for result, future in zip(results, futures):
+            if result.accepted:
+                future.set_result(None)
+            else:
+                future.set_exception(result.error)
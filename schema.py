@@ -0,0 +1,162 @@
+import logging
+
+from sqlalchemy import MetaData, Table, inspect, text
+from sqlalchemy.schema import CreateColumn
+
+from bank import Base
+from migrations import Migration, migrate, version_table
+# not imported by the models, but its journal_offset table belongs to bank.db
+import journal
+
+# create_all only creates missing tables, it never changes a table that already exists.
+# Columns and indexes added to the models before versioned migrations are added by upgrade()
+# instead. New columns and tables (column None) are then filled in from the existing data by
+# these statements, run in this order.
+
+# data that can always be recomputed from the transactions
+DERIVED = [
+    ("bank", "_last_account_number",
+     "UPDATE bank SET _last_account_number = (SELECT COALESCE(MAX(a._account_number), 0) FROM account a WHERE a._bank_id = bank._id)"),
+    ("account", "_balance_cents",
+     'UPDATE account SET _balance_cents = (SELECT COALESCE(SUM(t._amt_cents), 0) FROM "transaction" t WHERE t._account_id = account._id)'),
+    ("account", "_latest_date",
+     'UPDATE account SET _latest_date = (SELECT MAX(date(t._date)) FROM "transaction" t WHERE t._account_id = account._id)'),
+    ("account", "_latest_exempt_date",
+     'UPDATE account SET _latest_exempt_date = (SELECT MAX(date(t._date)) FROM "transaction" t WHERE t._account_id = account._id AND t._exempt)'),
+    ("transaction_counter", None,
+     "INSERT INTO transaction_counter (_account_id, _period_type, _period, _count) "
+     "SELECT _account_id, 'day', date(_date), COUNT(*) FROM \"transaction\" WHERE NOT _exempt GROUP BY 1, 3"),
+    ("transaction_counter", None,
+     "INSERT INTO transaction_counter (_account_id, _period_type, _period, _count) "
+     "SELECT _account_id, 'month', date(_date, 'start of month'), COUNT(*) FROM \"transaction\" WHERE NOT _exempt GROUP BY 1, 3"),
+    # running total of each account's monthly net amounts
+    ("balance_checkpoint", None,
+     "INSERT INTO balance_checkpoint (_account_id, _month, _balance_cents) "
+     "SELECT _account_id, month, SUM(SUM(_amt_cents)) OVER (PARTITION BY _account_id ORDER BY month) "
+     "FROM (SELECT _account_id, date(_date, 'start of month') AS month, _amt_cents FROM \"transaction\") GROUP BY 1, 2"),
+]
+
+BACKFILLS = [
+    # amounts moved from a NUMERIC column (stored as floats by SQLite) to integer cents
+    ("transaction", "_amt_cents",
+     'UPDATE "transaction" SET _amt_cents = CAST(ROUND(_amt * 100) AS INTEGER)'),
+] + DERIVED
+
+# columns that were replaced, and are dropped once their data has been converted
+RETIRED = [
+    ("transaction", "_amt"),
+    ("account", "_balance"),
+]
+
+
+# tables, (table, column) pairs and indexes that the models gained after version 1. Each later migration
+# adds its own with explicit DDL, so add to these whenever a migration adds a table, column or index to the models
+LATER_TABLES = {"journal_offset"}
+LATER_COLUMNS = set()
+LATER_INDEXES = {"ix_transaction_account_date"}
+
+
+def version_1_tables() -> list[Table]:
+    "Copies of the models' tables as they were at version 1, without LATER_TABLES, LATER_COLUMNS and LATER_INDEXES"
+    metadata = MetaData()
+    tables = []
+    for table in Base.metadata.sorted_tables:
+        if table.name in LATER_TABLES:
+            continue
+        copy = table.to_metadata(metadata)
+        for column in list(copy.columns):
+            if (copy.name, column.name) in LATER_COLUMNS:
+                # Table has no public way to drop a column, and the copy is only used to emit DDL
+                copy._columns.remove(column)
+        copy.indexes = {index for index in copy.indexes if index.name not in LATER_INDEXES}
+        tables.append(copy)
+    return tables
+
+
+def _renumber_duplicate_accounts(conn) -> None:
+    """Gives accounts that share a number with an older account in the same bank new numbers after the bank's last one,
+    so that ix_account_bank_number can be created. Banks from before the persisted counter could number two accounts alike.
+    """
+    duplicates = conn.execute(text(
+        "SELECT a._id, a._bank_id, a._account_number FROM account a WHERE EXISTS (SELECT 1 FROM account b "
+        "WHERE b._bank_id = a._bank_id AND b._account_number = a._account_number AND b._id < a._id) ORDER BY a._id"
+    )).all()
+    for acct_id, bank_id, number in duplicates:
+        new_number = conn.execute(text("SELECT MAX(_account_number) + 1 FROM account WHERE _bank_id = :bank_id"),
+                                  {"bank_id": bank_id}).scalar()
+        conn.execute(text("UPDATE account SET _account_number = :number WHERE _id = :id"),
+                     {"number": new_number, "id": acct_id})
+        logging.warning("Renumbered account #%09d of bank %d (id %d), a duplicate, to #%09d",
+                        number, bank_id, acct_id, new_number)
+    if duplicates:
+        # the counter has to stay ahead of the new numbers
+        conn.execute(text(
+            "UPDATE bank SET _last_account_number = MAX(COALESCE(_last_account_number, 0), "
+            "(SELECT COALESCE(MAX(a._account_number), 0) FROM account a WHERE a._bank_id = bank._id))"))
+
+
+def upgrade(engine) -> None:
+    """Brings a database from before versioned migrations up to version 1: creates any missing tables and adds any missing
+    columns and indexes, backfilling them from the data already stored. Works from version_1_tables(), not the models.
+    """
+    tables = version_1_tables()
+    existing_tables = set(inspect(engine).get_table_names())
+    tables[0].metadata.create_all(engine, tables=tables)
+    existing = inspect(engine)
+    added = {(table.name, None) for table in tables if table.name not in existing_tables}
+    with engine.begin() as conn:
+        for table in tables:
+            if table.name not in existing_tables:
+                continue
+            columns = {c["name"] for c in existing.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN {ddl}'))
+                    added.add((table.name, column.name))
+        if "account" in existing_tables:
+            _renumber_duplicate_accounts(conn)
+        for table_name, column_name, sql in BACKFILLS:
+            if (table_name, column_name) in added:
+                conn.execute(text(sql))
+        if engine.dialect.name != "sqlite" or engine.dialect.dbapi.sqlite_version_info >= (3, 35):
+            for table_name, column_name in RETIRED:
+                if table_name in existing_tables and column_name in {c["name"] for c in existing.get_columns(table_name)}:
+                    conn.execute(text(f'ALTER TABLE "{table_name}" DROP COLUMN {column_name}'))
+        for table in tables:
+            if table.name not in existing_tables:
+                continue
+            indexes = {i["name"] for i in existing.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+
+
+# The history of bank.db. Add a migration whenever a model gains a table, column or index,
+# so that existing databases are upgraded the next time a front end starts. Each step after
+# the first is the exact DDL and backfill for that change, since the models only describe the
+# latest version. upgrade() is only the baseline for databases from before versioning.
+MIGRATIONS = [
+    Migration(1, "add the tables, columns and indexes from before versioned migrations", upgrade),
+    Migration(2, "index transactions by account and date", (
+        'CREATE INDEX IF NOT EXISTS ix_transaction_account_date ON "transaction" (_account_id, _date)',
+    )),
+    Migration(3, "add the journal_offset table", (
+        "CREATE TABLE IF NOT EXISTS journal_offset ("
+        "_journal VARCHAR NOT NULL, _offset INTEGER NOT NULL, PRIMARY KEY (_journal))",
+    )),
+]
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+# a single row with the version of the last migration applied to the database
+schema_version = version_table(Base.metadata)
+
+
+def ensure_current(engine) -> bool:
+    """Applies any MIGRATIONS newer than the database's version, or creates every table in an empty database.
+    Otherwise costs a single query.
+
+    Returns:
+        bool: true if the database was migrated
+    """
+    return bool(migrate(engine, Base.metadata, MIGRATIONS))
@@ -0,0 +1,176 @@
+import atexit
+import os
+import re
+import sys
+import threading
+import traceback
+from contextlib import contextmanager, nullcontext
+
+from sqlalchemy import event
+
+# BANK_SQL_TRACE=1 makes the front ends trace their engine and print report() at exit
+ENABLED = os.environ.get("BANK_SQL_TRACE", "").lower() not in ("", "0", "false", "no")
+
+# a statement shape repeated this many times within one run of an operation is reported as a likely N+1
+REPEAT_THRESHOLD = 3
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_HERE = os.path.abspath(__file__)
+_SQLALCHEMY = os.sep + "sqlalchemy" + os.sep
+
+
+def normalize(statement) -> str:
+    "Reduces a SQL statement to its shape: literals become ?, lists of ? become (?...), whitespace is collapsed"
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _LITERALS.sub("?", shape)
+    return _LISTS.sub("(?...)", shape)
+
+
+def _stack_hint(limit=3) -> str:
+    "The innermost application frames that led to a statement, e.g. 'accounts.py:120 get_balance'"
+    frames = [frame for frame in traceback.extract_stack()
+              if _SQLALCHEMY not in frame.filename and os.path.abspath(frame.filename) != _HERE
+              and "contextlib" not in frame.filename]
+    return " <- ".join(f"{os.path.basename(f.filename)}:{f.lineno} {f.name}" for f in reversed(frames[-limit:]))
+
+
+class StatementTracer:
+    """Counts the statements an engine executes, grouped by logical operation and by normalized SQL shape.
+    A shape repeated within a single run of an operation is flagged as a likely N+1 query, with a hint of
+    where it came from. Running the same operation several times only adds to its totals.
+
+    Use it as a context manager, or call start() and stop().
+    """
+    def __init__(self, engine, repeat_threshold=REPEAT_THRESHOLD) -> None:
+        self._engine = engine
+        self._repeat_threshold = repeat_threshold
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # operation -> shape -> total count
+        self._operations = {}
+        # (operation, shape) -> [most times repeated in one run, stack hint of the first repeat]
+        self._repeats = {}
+
+    def start(self) -> "StatementTracer":
+        event.listen(self._engine, "before_cursor_execute", self._before_cursor_execute)
+        return self
+
+    def stop(self) -> None:
+        event.remove(self._engine, "before_cursor_execute", self._before_cursor_execute)
+
+    def __enter__(self) -> "StatementTracer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    @contextmanager
+    def operation(self, name):
+        "Attributes the statements executed inside the block (on this thread) to one run of the named operation"
+        stack = self._local.__dict__.setdefault("operations", [])
+        # shape -> count for this run only
+        stack.append((name, {}))
+        try:
+            yield self
+        finally:
+            stack.pop()
+
+    def _current_run(self) -> tuple[str, dict]:
+        stack = self._local.__dict__.get("operations")
+        if stack:
+            return stack[-1]
+        # statements outside any operation count as one long run per thread
+        return "(no operation)", self._local.__dict__.setdefault("unlabelled", {})
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        shape = normalize(statement)
+        operation, run = self._current_run()
+        repeats = run[shape] = run.get(shape, 0) + 1
+        with self._lock:
+            shapes = self._operations.setdefault(operation, {})
+            shapes[shape] = shapes.get(shape, 0) + 1
+            if repeats >= self._repeat_threshold:
+                entry = self._repeats.get((operation, shape))
+                if entry is None:
+                    # only walk the stack once a shape looks suspicious
+                    self._repeats[operation, shape] = [repeats, _stack_hint()]
+                elif repeats > entry[0]:
+                    entry[0] = repeats
+
+    def count(self, operation=None) -> int:
+        "Number of statements executed, for one operation or in total, over all of its runs"
+        with self._lock:
+            if operation is not None:
+                return sum(self._operations.get(operation, {}).values())
+            return sum(sum(shapes.values()) for shapes in self._operations.values())
+
+    def repeated(self) -> list[tuple[str, str, int, str]]:
+        """Statement shapes repeated at least repeat_threshold times within a single run of an operation.
+
+        Returns:
+            list[tuple[str, str, int, str]]: (operation, shape, most repeats in one run, stack hint), most repeated first
+        """
+        with self._lock:
+            found = [(operation, shape, count, hint) for (operation, shape), (count, hint) in self._repeats.items()]
+        return sorted(found, key=lambda row: row[2], reverse=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._operations.clear()
+            self._repeats.clear()
+
+    def report(self, max_shape_length=120) -> str:
+        "Formats statement counts per operation and per shape, followed by the likely N+1 queries"
+        with self._lock:
+            operations = {name: dict(shapes) for name, shapes in self._operations.items()}
+        lines = []
+        for name, shapes in sorted(operations.items()):
+            lines.append(f"{name}: {sum(shapes.values())} statement(s)")
+            for shape, count in sorted(shapes.items(), key=lambda item: item[1], reverse=True):
+                lines.append(f"  {count:>6} x {shape[:max_shape_length]}")
+        for operation, shape, count, hint in self.repeated():
+            lines.append(f"possible N+1 in {operation}: {count} x {shape[:max_shape_length]} in one run")
+            lines.append(f"  from {hint}")
+        return "\n".join(lines)
+
+
+_active = None
+
+
+def trace(engine, report_at_exit=True) -> StatementTracer:
+    """Starts tracing an engine for the rest of the run, so that operation() labels its statements.
+
+    Args:
+        report_at_exit (bool, optional): prints the tracer's report to stderr when the program exits. Defaults to True.
+    """
+    global _active
+    _active = StatementTracer(engine).start()
+    if report_at_exit:
+        atexit.register(lambda tracer=_active: print(tracer.report(), file=sys.stderr))
+    return _active
+
+
+def operation(name):
+    "Labels statements with the operation name if trace() was called, otherwise does nothing"
+    return _active.operation(name) if _active is not None else nullcontext()
+
+
+@contextmanager
+def statement_budget(engine, max_statements, operation="budget"):
+    """Test helper that fails if the block executes more than max_statements statements.
+
+    For example:
+        with statement_budget(engine, 2):
+            bank.summary(session)
+
+    Raises:
+        AssertionError: with the tracer report, if the budget was exceeded
+    """
+    with StatementTracer(engine) as tracer, tracer.operation(operation):
+        yield tracer
+    count = tracer.count(operation)
+    if count > max_statements:
+        raise AssertionError(f"{operation} executed {count} statements, expected at most {max_statements}\n"
+                             + tracer.report())
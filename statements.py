@@ -0,0 +1,150 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import groupby, chain
+
+from sqlalchemy import select, func, and_
+from sqlalchemy.orm import Session
+
+from accounts import Account
+from transactions import Transaction, last_day_of_month
+from checkpoints import BalanceCheckpoint
+from database import make_engine
+
+CSV = "csv"
+JSONL = "jsonl"
+FORMATS = (CSV, JSONL)
+# rows fetched from the database per batch, so memory stays flat however many transactions there are
+BATCH_SIZE = 1000
+
+_FIELDS = ("date", "description", "amount", "balance")
+
+
+def _description(amt, exempt) -> str:
+    if exempt:
+        return "interest" if amt >= 0 else "fee"
+    return "deposit" if amt >= 0 else "withdrawal"
+
+
+def statement_records(opening, transactions, month_start, month_end):
+    """Turns an account's opening balance and its transactions for the month into statement lines.
+
+    Args:
+        opening (Decimal): balance at the end of the previous month
+        transactions (iterable): (date, amount, exempt) tuples in date order
+
+    Yields:
+        dict: date, description, amount and balance of the opening balance, each transaction and the closing balance
+    """
+    balance = opening
+    yield {"date": month_start.isoformat(), "description": "opening balance", "amount": "", "balance": f"{balance:.2f}"}
+    for date, amt, exempt in transactions:
+        balance += amt
+        day = date.date() if isinstance(date, datetime) else date
+        yield {"date": day.isoformat(), "description": _description(amt, exempt),
+               "amount": f"{amt:.2f}", "balance": f"{balance:.2f}"}
+    yield {"date": month_end.isoformat(), "description": "closing balance", "amount": "", "balance": f"{balance:.2f}"}
+
+
+def _write_file(path, fmt, records) -> None:
+    with open(path, "w", newline="") as f:
+        if fmt == CSV:
+            writer = csv.DictWriter(f, fieldnames=_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+        else:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+
+def statement_path(out_dir, acct_num, month, fmt) -> str:
+    "File name of an account's statement, e.g. statements/000000001-2023-01.csv"
+    return os.path.join(out_dir, f"{acct_num:09}-{month.year}-{month.month:02}.{fmt}")
+
+
+def _write_range(session, bank_id, month, out_dir, fmt, first=None, last=None) -> int:
+    """Writes the statements of the bank's accounts numbered first to last from a single ordered query.
+
+    Returns:
+        int: number of statements written
+    """
+    month_start = month.replace(day=1)
+    month_end = last_day_of_month(month_start)
+    # closing balance of the latest earlier month with transactions
+    opening = (select(BalanceCheckpoint._balance)
+               .where(BalanceCheckpoint._account_id == Account._id, BalanceCheckpoint._month < month_start)
+               .order_by(BalanceCheckpoint._month.desc())
+               .limit(1)
+               .scalar_subquery())
+    query = (select(Account._account_number, opening, Transaction._date, Transaction._amt, Transaction._exempt)
+             .outerjoin(Transaction, and_(Transaction._account_id == Account._id,
+                                          Transaction._date >= month_start,
+                                          Transaction._date < month_end + timedelta(days=1)))
+             .where(Account._bank_id == bank_id)
+             .order_by(Account._account_number, Transaction._date, Transaction._id)
+             .execution_options(yield_per=BATCH_SIZE))
+    if first is not None:
+        query = query.where(Account._account_number >= first)
+    if last is not None:
+        query = query.where(Account._account_number <= last)
+
+    written = 0
+    # rows arrive grouped by account, so only one account's rows are in flight at a time
+    for acct_num, rows in groupby(session.execute(query), key=lambda row: row[0]):
+        row = next(rows)
+        # accounts without transactions in the month come back as one row of NULLs from the outer join
+        transactions = ((date, amt, exempt) for _, _, date, amt, exempt in chain([row], rows) if date is not None)
+        records = statement_records(row[1] or Decimal(0), transactions, month_start, month_end)
+        _write_file(statement_path(out_dir, acct_num, month_start, fmt), fmt, records)
+        written += 1
+    return written
+
+
+def _write_range_in_worker(url, bank_id, month, out_dir, fmt, first, last) -> int:
+    "Process pool entry point: writes one range of statements over the worker's own connection"
+    engine = make_engine("batch", url=url)
+    try:
+        with Session(engine) as session:
+            return _write_range(session, bank_id, month, out_dir, fmt, first, last)
+    finally:
+        engine.dispose()
+
+
+def write_statements(session, bank, month, out_dir, fmt=CSV, workers=1) -> int:
+    """Writes a statement file for every account in the bank with its opening balance, the month's transactions,
+    interest and fees, and closing balance. Transactions are streamed in account and date order, so memory use
+    doesn't depend on the number of accounts or transactions.
+
+    Args:
+        month (Date): any date in the month
+        out_dir (str): directory for the statement files. Created if it doesn't exist.
+        fmt (str, optional): "csv" or "jsonl". Defaults to "csv".
+        workers (int, optional): processes to split the accounts between, each with its own
+            query and connection. 1 writes everything in this process. Defaults to 1.
+
+    Returns:
+        int: number of statements written
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown statement format {fmt!r}")
+    os.makedirs(out_dir, exist_ok=True)
+    if workers <= 1:
+        return _write_range(session, bank._id, month, out_dir, fmt)
+
+    first, last = session.execute(
+        select(func.min(Account._account_number), func.max(Account._account_number))
+        .where(Account._bank_id == bank._id)
+    ).one()
+    if first is None:
+        return 0
+    # account numbers are handed out in sequence, so equal number ranges hold about as many accounts
+    step = (last - first) // workers + 1
+    ranges = [(start, min(start + step - 1, last)) for start in range(first, last + 1, step)]
+    url = session.get_bind().url.render_as_string(hide_password=False)
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [pool.submit(_write_range_in_worker, url, bank._id, month, out_dir, fmt, start, end)
+                   for start, end in ranges]
+        return sum(future.result() for future in futures)
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import schema
+from bank import Bank
+from database import make_engine
+from sqlalchemy.orm import sessionmaker
+
+
+@pytest.fixture
+def engine(tmp_path):
+    "A new, current bank.db in a temporary directory"
+    engine = make_engine("batch", url=f"sqlite:///{tmp_path / 'bank.db'}", echo=False)
+    schema.ensure_current(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    with sessionmaker(engine)() as session:
+        yield session
+
+
+@pytest.fixture
+def bank(session):
+    bank = Bank()
+    session.add(bank)
+    session.commit()
+    return bank
@@ -0,0 +1,127 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
+
+import sqltrace
+from accounts import commit_with_retry
+from bank import Bank
+from counters import DAY, MONTH
+from exceptions import ConcurrentUpdateError, TransactionLimitError
+
+
+def test_commit_with_retry_runs_stage_again_after_a_conflict(session):
+    calls = []
+
+    def stage():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise StaleDataError("changed by another session")
+        return "done"
+
+    assert commit_with_retry(session, stage) == "done"
+    assert calls == [0, 1]
+
+
+def test_commit_with_retry_gives_up(session):
+    def stage():
+        raise StaleDataError("changed by another session")
+
+    with pytest.raises(ConcurrentUpdateError) as e:
+        commit_with_retry(session, stage, attempts=3)
+    assert e.value.attempts == 3
+
+
+def test_add_transaction_retries_against_the_other_writers_balance(engine, session, bank):
+    bank.add_account(session, "checking")
+    account = bank.get_account(1)
+    account.add_transaction(session, Decimal("100.00"), date(2023, 1, 2))
+
+    # a second writer spends most of the money after this session loaded the account
+    with sessionmaker(engine)() as other:
+        other.get(Bank, bank._id).get_account(1).add_transaction(other, Decimal("-80.00"), date(2023, 1, 3))
+
+    account.add_transaction(session, Decimal("-15.00"), date(2023, 1, 4))
+    assert account.get_balance() == Decimal("5.00")
+    assert bank.reconcile(session) == []
+
+
+def test_savings_limits_are_read_from_the_counters(session, bank):
+    bank.add_account(session, "savings")
+    savings = bank.get_account(1)
+    savings.add_transaction(session, Decimal("100.00"), date(2023, 1, 1))
+    savings.add_transaction(session, Decimal("1.00"), date(2023, 1, 1))
+    with pytest.raises(TransactionLimitError) as e:
+        savings.add_transaction(session, Decimal("1.00"), date(2023, 1, 1))
+    assert (e.value.limit_type, e.value.limit) == ("day", 2)
+    # exempt transactions don't count towards the limits
+    savings.add_transaction(session, Decimal("0.10"), date(2023, 1, 2), exempt=True)
+
+    for day in (2, 3, 4):
+        savings.add_transaction(session, Decimal("1.00"), date(2023, 1, day))
+    with pytest.raises(TransactionLimitError) as e:
+        savings.add_transaction(session, Decimal("1.00"), date(2023, 1, 5))
+    assert (e.value.limit_type, e.value.limit) == ("month", 5)
+    savings.add_transaction(session, Decimal("1.00"), date(2023, 2, 1))
+
+    assert savings.count_transactions(session, DAY, date(2023, 1, 1)) == 2
+    assert savings.count_transactions(session, MONTH, date(2023, 1, 31)) == 5
+    assert bank.transaction_counts(session, MONTH, date(2023, 2, 1)) == [(1, 1)]
+    assert savings.get_balance() == Decimal("105.10")
+
+
+def test_add_transaction_looks_each_counter_up_once(engine, session, bank):
+    bank.add_account(session, "savings")
+    savings = bank.get_account(1)
+    savings.add_transaction(session, Decimal("100.00"), date(2023, 1, 1))
+    session.refresh(savings)
+
+    with sqltrace.StatementTracer(engine) as tracer, tracer.operation("add"):
+        # a new day and month, so neither counter exists yet
+        savings.add_transaction(session, Decimal("1.00"), date(2023, 2, 1))
+    counter_lookups = [count for operation, shape, count, _ in tracer.repeated() if "transaction_counter" in shape]
+    assert counter_lookups == []
+    assert tracer.count("add") < 10
+
+
+def _history(session, bank):
+    "A checking account with two deposits a day from 2023-01-01 to 2023-01-05"
+    bank.add_account(session, "checking")
+    account = bank.get_account(1)
+    account.add_transactions(session, [(Decimal(f"{day}.0{i}"), date(2023, 1, day)) for day in range(1, 6) for i in (1, 2)])
+    return account
+
+
+def test_page_transactions_walks_the_history_with_a_cursor(session, bank):
+    account = _history(session, bank)
+    pages = []
+    cursor = None
+    while True:
+        page, cursor = account.page_transactions(session, 3, after=cursor)
+        pages.append([t._amt for t in page])
+        if cursor is None:
+            break
+    # two transactions share each date, so the cursor has to break ties by id
+    assert pages == [
+        [Decimal("1.01"), Decimal("1.02"), Decimal("2.01")],
+        [Decimal("2.02"), Decimal("3.01"), Decimal("3.02")],
+        [Decimal("4.01"), Decimal("4.02"), Decimal("5.01")],
+        [Decimal("5.02")],
+    ]
+
+
+def test_page_transactions_date_bounds_include_both_ends(session, bank):
+    account = _history(session, bank)
+    page, cursor = account.page_transactions(session, 4, start=date(2023, 1, 2), end=date(2023, 1, 3))
+    assert [t._amt for t in page] == [Decimal("2.01"), Decimal("2.02"), Decimal("3.01"), Decimal("3.02")]
+    # a full last page can't tell that nothing follows, so the next one is empty
+    assert cursor is not None
+    assert account.page_transactions(session, 4, start=date(2023, 1, 2), end=date(2023, 1, 3), after=cursor) == ([], None)
+
+
+def test_iter_transactions_streams_in_small_batches(session, bank):
+    account = _history(session, bank)
+    amounts = [t._amt for t in account.iter_transactions(session, start=date(2023, 1, 4), batch_size=1)]
+    assert amounts == [Decimal("4.01"), Decimal("4.02"), Decimal("5.01"), Decimal("5.02")]
@@ -0,0 +1,127 @@
+import threading
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+
+from accounts import Account
+from bank import Bank
+from exceptions import OverdrawError, TransactionLimitError, AccountNotFoundError
+
+
+def _open(session, bank, *deposits):
+    "Opens a checking account for each deposit, made on 2023-01-01"
+    for amount in deposits:
+        bank.add_account(session, "checking")
+        bank.get_account(len(bank.show_accounts())).add_transaction(session, Decimal(amount), date(2023, 1, 1))
+
+
+def _balances(bank):
+    return [account.get_balance() for account in bank.show_accounts()]
+
+
+def test_transfer_moves_the_amount(session, bank):
+    _open(session, bank, "100.00", "5.00")
+    assert bank.transfer(session, 1, 2, Decimal("40.00"), date(2023, 1, 2))
+    assert _balances(bank) == [Decimal("60.00"), Decimal("45.00")]
+    assert bank.reconcile(session) == []
+
+
+def test_rejected_transfer_changes_neither_account(session, bank):
+    _open(session, bank, "10.00", "5.00")
+    with pytest.raises(OverdrawError):
+        bank.transfer(session, 1, 2, Decimal("10.01"), date(2023, 1, 2))
+    session.expire_all()
+    assert _balances(bank) == [Decimal("10.00"), Decimal("5.00")]
+    assert [len(account.get_transactions()) for account in bank.show_accounts()] == [1, 1]
+
+
+def test_the_deposit_side_is_checked_before_the_withdrawal_is_made(session, bank):
+    _open(session, bank, "100.00")
+    bank.add_account(session, "savings")
+    savings = bank.get_account(2)
+    for _ in range(savings._daily_limit):
+        savings.add_transaction(session, Decimal("1.00"), date(2023, 1, 2))
+    with pytest.raises(TransactionLimitError):
+        bank.transfer(session, 1, 2, Decimal("10.00"), date(2023, 1, 2))
+    session.expire_all()
+    assert _balances(bank) == [Decimal("100.00"), Decimal("2.00")]
+
+
+def test_transfer_many_rejects_bad_rows_one_at_a_time(session, bank):
+    _open(session, bank, "100.00", "0.00")
+    results = bank.transfer_many(session, [
+        (1, 1, Decimal("1.00"), date(2023, 1, 2)),
+        (1, 2, Decimal("0.00"), date(2023, 1, 2)),
+        (1, 3, Decimal("1.00"), date(2023, 1, 2)),
+        (1, 2, Decimal("30.00"), date(2023, 1, 2)),
+        (2, 1, Decimal("31.00"), date(2023, 1, 3)),
+    ])
+    assert [result.accepted for result in results] == [False, False, False, True, False]
+    assert [type(result.error) for result in results] == [
+        ValueError, ValueError, AccountNotFoundError, type(None), OverdrawError]
+    assert _balances(bank) == [Decimal("70.00"), Decimal("30.00")]
+    with pytest.raises(ValueError):
+        bank.transfer(session, 2, 2, Decimal("1.00"), date(2023, 1, 3))
+
+
+def test_concurrent_transfer_batches_keep_the_total(engine, session, bank):
+    _open(session, bank, "1000.00", "1000.00", "1000.00")
+    sessions = sessionmaker(engine)
+    errors = []
+
+    def worker(offset):
+        try:
+            with sessions() as worker_session:
+                worker_bank = worker_session.get(Bank, bank._id)
+                for i in range(20):
+                    # each batch touches two accounts, and the threads go round the accounts in different directions
+                    source = (i + offset) % 3 + 1
+                    destination = (i + 2 * offset + 1) % 3 + 1
+                    if source == destination:
+                        destination = source % 3 + 1
+                    worker_bank.transfer_many(worker_session, [(source, destination, Decimal("1.00"), date(2023, 1, 2))])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+    assert not any(thread.is_alive() for thread in threads)
+    assert errors == []
+    session.expire_all()
+    assert sum(_balances(bank)) == Decimal("3000.00")
+    assert sum(len(account.get_transactions()) for account in bank.show_accounts()) == 3 + 4 * 20 * 2
+    assert bank.reconcile(session) == []
+
+
+def test_reconcile_reports_drifted_balances(session, bank):
+    _open(session, bank, "100.00", "5.00")
+    assert bank.reconcile(session) == []
+    session.execute(update(Account).where(Account._account_number == 2).values(_balance=Decimal("7.50")))
+    session.commit()
+
+    assert bank.reconcile(session) == [(2, Decimal("7.50"), Decimal("5.00"))]
+    # only reports unless asked to fix
+    assert bank.get_account(2).get_balance() == Decimal("7.50")
+    assert bank.reconcile(session, fix=True) == [(2, Decimal("7.50"), Decimal("5.00"))]
+    assert bank.get_account(2).get_balance() == Decimal("5.00")
+    assert bank.reconcile(session) == []
+
+
+@pytest.mark.parametrize("returning", [True, False])
+def test_account_numbers_come_from_the_counter(engine, session, bank, monkeypatch, returning):
+    # SQLite before 3.35 can't use UPDATE ... RETURNING
+    monkeypatch.setattr(engine.dialect, "update_returning", returning)
+    for acct_type in ("checking", "savings", "checking"):
+        bank.add_account(session, acct_type)
+    with sessionmaker(engine)() as other:
+        other.get(Bank, bank._id).add_account(other, "savings")
+    bank.add_account(session, "checking")
+    session.expire_all()
+    assert [account.account_number for account in bank.show_accounts()] == [1, 2, 3, 4, 5]
+    assert bank._last_account_number == 5
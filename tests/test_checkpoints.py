@@ -0,0 +1,70 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select, update
+
+from accounts import Account
+from checkpoints import BalanceCheckpoint
+
+# (amount, date), in date order over three months
+ROWS = [
+    ("100.00", date(2023, 1, 5)),
+    ("-20.05", date(2023, 1, 20)),
+    ("7.10", date(2023, 2, 1)),
+    ("-0.55", date(2023, 2, 28)),
+    ("13.00", date(2023, 4, 2)),
+]
+
+
+def _checkpoints(session, account):
+    return session.execute(
+        select(BalanceCheckpoint._month, BalanceCheckpoint._balance)
+        .where(BalanceCheckpoint._account_id == account._id)
+        .order_by(BalanceCheckpoint._month)
+    ).all()
+
+
+def _ledger_balance(day):
+    return sum((Decimal(amt) for amt, when in ROWS if when <= day), Decimal(0))
+
+
+def _open(session, bank):
+    bank.add_account(session, "checking")
+    account = bank.get_account(1)
+    for amt, day in ROWS:
+        account.add_transaction(session, Decimal(amt), day)
+    return account
+
+
+def test_each_write_updates_its_months_checkpoint(session, bank):
+    account = _open(session, bank)
+    assert _checkpoints(session, account) == [
+        (date(2023, 1, 1), Decimal("79.95")),
+        (date(2023, 2, 1), Decimal("86.50")),
+        (date(2023, 4, 1), Decimal("99.50")),
+    ]
+    account.add_transaction(session, Decimal("0.50"), date(2023, 4, 30))
+    assert _checkpoints(session, account)[-1] == (date(2023, 4, 1), Decimal("100.00"))
+
+
+def test_balance_as_of_matches_the_ledger_on_every_day(session, bank):
+    account = _open(session, bank)
+    day = date(2022, 12, 31)
+    while day <= date(2023, 5, 1):
+        assert account.balance_as_of(session, day) == _ledger_balance(day), day
+        day += timedelta(days=1)
+
+
+def test_reconcile_fix_rebuilds_the_drifted_checkpoints(session, bank):
+    account = _open(session, bank)
+    # a running total and its checkpoints that went wrong together
+    session.execute(update(Account).where(Account._id == account._id).values(_balance=Decimal("1.00")))
+    session.execute(update(BalanceCheckpoint).where(BalanceCheckpoint._account_id == account._id)
+                    .values(_balance=Decimal("1.00")))
+    session.commit()
+
+    assert len(bank.reconcile(session, fix=True)) == 1
+    assert bank.reconcile(session) == []
+    assert [balance for _, balance in _checkpoints(session, account)] == \
+        [Decimal("79.95"), Decimal("86.50"), Decimal("99.50")]
+    assert account.balance_as_of(session, date(2023, 3, 15)) == Decimal("86.50")
@@ -0,0 +1,63 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from exceptions import OverdrawError, TransactionLimitError, AccountNotFoundError, TransactionSequenceError
+from loader import read_transactions
+
+
+def test_import_transactions_checks_rows_in_order(session, bank):
+    bank.add_account(session, "savings")
+    bank.add_account(session, "checking")
+    results = bank.import_transactions(session, [
+        (1, Decimal("50.00"), date(2023, 1, 1)),
+        (1, Decimal("1.00"), date(2023, 1, 1)),
+        # the third on the same day, seen through the counters of the rows above, which aren't committed yet
+        (1, Decimal("1.00"), date(2023, 1, 1)),
+        (2, Decimal("-1.00"), date(2023, 1, 1)),
+        (3, Decimal("1.00"), date(2023, 1, 1)),
+        (2, Decimal("20.00"), date(2023, 1, 3)),
+        (2, Decimal("5.00"), date(2023, 1, 2)),
+        (1, Decimal("0.33"), date(2023, 1, 31), True),
+    ])
+    assert [(r.row, r.account_number, r.accepted) for r in results] == [
+        (0, 1, True), (1, 1, True), (2, 1, False), (3, 2, False), (4, 3, False), (5, 2, True), (6, 2, False), (7, 1, True)]
+    assert [type(r.error) for r in results if not r.accepted] == [
+        TransactionLimitError, OverdrawError, AccountNotFoundError, TransactionSequenceError]
+    session.expire_all()
+    assert bank.get_account(1).get_balance() == Decimal("51.33")
+    assert bank.get_account(2).get_balance() == Decimal("20.00")
+    assert bank.reconcile(session) == []
+
+
+def test_add_transactions_commits_the_accepted_rows(session, bank):
+    bank.add_account(session, "checking")
+    account = bank.get_account(1)
+    results = account.add_transactions(session, [
+        (Decimal("10.00"), date(2023, 1, 1)),
+        (Decimal("-15.00"), date(2023, 1, 2)),
+        (Decimal("-4.00"), date(2023, 1, 2)),
+    ])
+    assert [r.accepted for r in results] == [True, False, True]
+    session.expire_all()
+    assert account.get_balance() == Decimal("6.00")
+    assert len(account.get_transactions()) == 2
+
+
+def test_read_transactions_from_csv_and_jsonl(tmp_path):
+    csv_path = tmp_path / "in.csv"
+    csv_path.write_text("account,amount,date,exempt\n1,10.50,2023-01-02,\n2,-3,2023-01-03,yes\n")
+    jsonl_path = tmp_path / "in.jsonl"
+    jsonl_path.write_text('{"account": 1, "amount": "10.50", "date": "2023-01-02"}\n\n'
+                          '{"account": "2", "amount": -3, "date": "2023-01-03", "exempt": true}\n')
+    expected = [(1, Decimal("10.50"), date(2023, 1, 2), False), (2, Decimal("-3"), date(2023, 1, 3), True)]
+    assert list(read_transactions(str(csv_path))) == expected
+    assert list(read_transactions(str(jsonl_path))) == expected
+
+
+def test_read_transactions_reports_the_bad_line(tmp_path):
+    path = tmp_path / "in.csv"
+    path.write_text("account,amount,date\n1,10.50,2023-01-02\n1,ten,2023-01-03\n")
+    with pytest.raises(ValueError, match="line 3"):
+        list(read_transactions(str(path)))
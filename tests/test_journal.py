@@ -0,0 +1,82 @@
+import logging
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from bank import Bank
+from exceptions import OverdrawError, JournalReplayError
+from journal import Journal, JournaledPipeline, applied_offset, replay, MAGIC, RECORD_SIZE
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = Journal(str(tmp_path / "bank.journal"))
+    yield journal
+    journal.close()
+
+
+def test_records_round_trip(journal):
+    rows = [(1, Decimal("2.50"), date(2023, 3, 1), False), (2, Decimal("-0.01"), date(2023, 3, 2), True)]
+    end = journal.append(rows)
+    assert end == len(MAGIC) + 2 * RECORD_SIZE
+    assert [row for _, row in journal.read()] == rows
+
+
+def test_replay_applies_unapplied_records_and_drops_a_torn_tail(session, bank, journal):
+    bank.add_account(session, "checking")
+    bank.add_account(session, "checking")
+    journal.append([(1, Decimal("2.50"), date(2023, 3, 1), False), (2, Decimal("3.75"), date(2023, 3, 2), False)])
+    good_end = journal.end
+    # a record cut short by a crash
+    journal._file.write(b"\x01\x02\x03torn")
+    journal._file.flush()
+
+    assert replay(session, bank, journal) == 2
+    assert journal.end == good_end
+    assert applied_offset(session, journal) == good_end
+    assert bank.get_account(1).get_balance() == Decimal("2.50")
+    assert bank.get_account(2).get_balance() == Decimal("3.75")
+    # already applied, so nothing happens the second time
+    assert replay(session, bank, journal) == 0
+    assert bank.get_account(1).get_balance() == Decimal("2.50")
+
+
+def test_pipeline_journals_accepted_rows(engine, session, bank, tmp_path):
+    bank.add_account(session, "checking")
+    path = str(tmp_path / "pipeline.journal")
+    with JournaledPipeline(engine, path, bank._id) as pipeline:
+        pipeline.submit(1, Decimal("5.00"), date(2023, 1, 1)).result()
+        with pytest.raises(OverdrawError):
+            pipeline.submit(1, Decimal("-10.00"), date(2023, 1, 2)).result()
+
+    journal = Journal(path)
+    assert [row for _, row in journal.read()] == [(1, Decimal("5.00"), date(2023, 1, 1), False)]
+    session.expire_all()
+    assert applied_offset(session, journal) == journal.end
+    assert session.get(Bank, bank._id).get_account(1).get_balance() == Decimal("5.00")
+    journal.close()
+
+
+def test_replay_stops_at_a_rejected_record_without_dropping_it(session, bank, journal):
+    bank.add_account(session, "checking")
+    start = applied_offset(session, journal)
+    # passed the rules when it was journaled, but the database has no money in the account
+    journal.append([(1, Decimal("-5.00"), date(2023, 3, 1), False)])
+
+    with pytest.raises(JournalReplayError) as e:
+        replay(session, bank, journal)
+    assert e.value.account_number == 1
+    assert isinstance(e.value.error, OverdrawError)
+    assert applied_offset(session, journal) == start
+    assert bank.get_account(1).get_balance() == Decimal("0.00")
+
+
+def test_pipeline_audits_rejected_rows(engine, session, bank, tmp_path, caplog):
+    bank.add_account(session, "checking")
+    with caplog.at_level(logging.INFO, logger="bank.audit"):
+        with JournaledPipeline(engine, str(tmp_path / "pipeline.journal"), bank._id) as pipeline:
+            with pytest.raises(OverdrawError):
+                pipeline.submit(1, Decimal("-10.00"), date(2023, 1, 2)).result()
+    assert [(record.account, record.outcome, record.reason) for record in caplog.records
+            if record.getMessage() == "transaction"] == [(1, "rejected", "OverdrawError")]
@@ -0,0 +1,56 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from ledger import Ledger
+from money import from_cents
+
+
+@pytest.fixture
+def ledger_bank(session, bank):
+    "Three accounts: two with transactions over January and February 2023, and an empty one"
+    for acct_type in ("checking", "savings", "checking"):
+        bank.add_account(session, acct_type)
+    bank.import_transactions(session, [
+        (1, Decimal("100.00"), date(2023, 1, 3)),
+        (1, Decimal("-30.25"), date(2023, 1, 20)),
+        (1, Decimal("0.23"), date(2023, 1, 31), True),
+        (1, Decimal("5.00"), date(2023, 2, 2)),
+        (2, Decimal("10.00"), date(2023, 2, 14)),
+        (2, Decimal("-0.01"), date(2023, 2, 15)),
+    ])
+    return bank
+
+
+def test_for_bank_balances_and_running_balances(session, ledger_bank):
+    ledger = Ledger.for_bank(session, ledger_bank)
+    assert len(ledger) == 6
+    assert ledger.account_numbers.tolist() == [1, 2, 3]
+    assert ledger.balances().tolist() == [7498, 999, 0]
+    assert ledger.running_balances().tolist() == [10000, 6975, 6998, 7498, 1000, 999]
+    assert ledger.days.tolist()[:2] == [date(2023, 1, 3).toordinal(), date(2023, 1, 20).toordinal()]
+    assert ledger.exempt.tolist() == [False, False, True, False, False, False]
+    # the same totals as the stored balances
+    assert [from_cents(cents) for cents in ledger.balances().tolist()] == \
+        [account.get_balance() for account in ledger_bank.show_accounts()]
+
+
+def test_monthly_totals(session, ledger_bank):
+    numbers, months, totals = Ledger.for_bank(session, ledger_bank).monthly_totals()
+    assert numbers.tolist() == [1, 1, 2]
+    assert months.astype(str).tolist() == ["2023-01", "2023-02", "2023-02"]
+    assert totals.tolist() == [6998, 500, 999]
+    _, _, totals = Ledger.for_bank(session, ledger_bank).monthly_totals(include_exempt=False)
+    assert totals.tolist() == [6975, 500, 999]
+
+
+def test_for_account_with_a_date_range(session, ledger_bank):
+    ledger = Ledger.for_account(session, ledger_bank.get_account(1), start=date(2023, 1, 20), end=date(2023, 1, 31))
+    assert ledger.cents.tolist() == [-3025, 23]
+    assert ledger.balances().tolist() == [-3002]
+    empty = Ledger.for_account(session, ledger_bank.get_account(3))
+    assert len(empty) == 0 and empty.balances().tolist() == [0]
+    assert empty.monthly_totals()[2].tolist() == []
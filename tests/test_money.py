@@ -0,0 +1,27 @@
+import logging
+from datetime import date
+from decimal import Decimal, BasicContext, localcontext
+
+from money import round_cents, to_cents, from_cents
+
+
+def test_conversions_ignore_a_narrow_current_context():
+    # the front ends run with BasicContext, which only has 9 digits
+    with localcontext(BasicContext):
+        assert round_cents(Decimal("10000000")) == Decimal("10000000.00")
+        assert to_cents(Decimal("123456789.125")) == 12345678913
+        assert from_cents(12345678901) == Decimal("123456789.01")
+
+
+def test_round_cents_rounds_half_up():
+    assert round_cents(Decimal("0.3135")) == Decimal("0.31")
+    assert round_cents(Decimal("0.005")) == Decimal("0.01")
+    assert round_cents(Decimal("-0.005")) == Decimal("-0.01")
+
+
+def test_audit_records_the_stored_amount(session, bank, caplog):
+    bank.add_account(session, "savings")
+    with caplog.at_level(logging.INFO, logger="bank.audit"):
+        bank.get_account(1).add_transaction(session, Decimal("0.3135"), date(2023, 1, 31))
+    assert [record.amount for record in caplog.records if record.getMessage() == "transaction"] == [Decimal("0.31")]
+    assert bank.get_account(1).get_transactions()[0]._amt == Decimal("0.31")
@@ -0,0 +1,80 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+from bank import Bank, AVERAGE_DAILY_INTEREST
+from money import round_cents
+from transactions import last_day_of_month
+
+# (account type, [(amount, day of March 2023)])
+ACCOUNTS = [
+    ("savings", [("100.00", 4)]),
+    ("checking", [("50.00", 4)]),
+    ("checking", [("99.99", 4)]),
+    ("checking", [("1000.00", 1), ("-250.00", 15), ("12.34", 31)]),
+    ("savings", [("0.01", 2)]),
+]
+
+
+def _build(session):
+    bank = Bank()
+    session.add(bank)
+    session.commit()
+    for acct_type, rows in ACCOUNTS:
+        bank.add_account(session, acct_type)
+        account = bank.get_account(len(bank.show_accounts()))
+        for amt, day in rows:
+            account.add_transaction(session, Decimal(amt), date(2023, 3, day))
+    return bank
+
+
+def _postings(session, bank):
+    return [[(t._amt, t._date.date()) for t in account.get_transactions() if t.is_exempt()]
+            for account in bank.show_accounts()]
+
+
+def test_run_month_end_matches_assessing_each_account(session):
+    assessed = _build(session)
+    for account in assessed.show_accounts():
+        account.assess_interest_and_fees(session)
+
+    bulk = _build(session)
+    posted = bulk.run_month_end(session, date(2023, 3, 15))
+    session.expire_all()
+
+    assert [account.get_balance() for account in bulk.show_accounts()] == \
+        [account.get_balance() for account in assessed.show_accounts()]
+    assert _postings(session, bulk) == _postings(session, assessed)
+    assert [amounts for _, amounts in posted] == [[amt for amt, _ in rows] for rows in _postings(session, bulk)]
+    # the low balance fee is posted to the checking accounts under the threshold
+    assert len(posted[1][1]) == 2 and len(posted[3][1]) == 1
+    assert bulk.reconcile(session) == []
+
+
+def test_run_month_end_skips_accounts_already_closed(session):
+    bank = _build(session)
+    assert len(bank.run_month_end(session, date(2023, 3, 1))) == len(ACCOUNTS)
+    assert bank.run_month_end(session, date(2023, 3, 1)) == []
+
+
+def test_average_daily_interest_matches_the_daily_balances(session):
+    pytest.importorskip("numpy")
+    bank = _build(session)
+    month_end = last_day_of_month(date(2023, 3, 1))
+    expected = []
+    for account in bank.show_accounts():
+        days = [date(2023, 3, 1) + timedelta(days=i) for i in range(month_end.day)]
+        total = sum(account.balance_as_of(session, day) for day in days)
+        expected.append(round_cents(total / len(days) * account._interest_rate))
+
+    posted = bank.run_month_end(session, month_end, AVERAGE_DAILY_INTEREST)
+
+    assert [amounts[0] for _, amounts in posted] == expected
+    assert bank.reconcile(session) == []
+
+
+def test_unknown_interest_method(session):
+    bank = _build(session)
+    with pytest.raises(ValueError):
+        bank.run_month_end(session, date(2023, 3, 1), "compound")
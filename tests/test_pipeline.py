@@ -0,0 +1,52 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+import schema
+from bank import Bank
+from database import make_engine
+from exceptions import AccountNotFoundError
+from pipeline import WritePipeline
+
+
+def test_rows_are_committed_in_order(session, bank, engine):
+    bank.add_account(session, "checking")
+    with WritePipeline(engine, bank._id) as pipeline:
+        futures = [pipeline.submit(1, Decimal("1.00"), date(2023, 1, day)) for day in range(1, 11)]
+        missing = pipeline.submit(99, Decimal("1.00"), date(2023, 1, 11))
+        for future in futures:
+            assert future.result() is None
+        with pytest.raises(AccountNotFoundError):
+            missing.result()
+    session.expire_all()
+    assert bank.get_account(1).get_balance() == Decimal("10.00")
+
+
+def test_submits_fail_once_the_writer_has_died(tmp_path):
+    # no tables, so the writer can't load the bank
+    engine = make_engine("batch", url=f"sqlite:///{tmp_path / 'empty.db'}", echo=False)
+    with WritePipeline(engine) as pipeline:
+        first = pipeline.submit(1, Decimal("1.00"), date(2023, 1, 1))
+        with pytest.raises(OperationalError):
+            first.result(timeout=5)
+        with pytest.raises(OperationalError):
+            pipeline.submit(1, Decimal("1.00"), date(2023, 1, 2)).result(timeout=5)
+    engine.dispose()
+
+
+def test_in_memory_database_is_shared_with_the_writer():
+    engine = make_engine("batch", url="sqlite://", echo=False)
+    schema.ensure_current(engine)
+    with sessionmaker(engine)() as session:
+        bank = Bank()
+        session.add(bank)
+        session.commit()
+        bank.add_account(session, "savings")
+        with WritePipeline(engine, bank._id) as pipeline:
+            pipeline.submit(1, Decimal("1.00"), date(2023, 1, 1)).result(timeout=5)
+        session.expire_all()
+        assert bank.get_account(1).get_balance() == Decimal("1.00")
+    engine.dispose()
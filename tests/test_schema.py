@@ -0,0 +1,114 @@
+import logging
+import sqlite3
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import sessionmaker
+
+import schema
+from bank import Bank
+from checkpoints import BalanceCheckpoint
+from counters import MONTH
+from database import make_engine
+from migrations import Migration, get_version, migrate
+
+# bank.db as the first release created it, before integer cents, counters, checkpoints and versioning
+BASELINE = """
+CREATE TABLE bank (_id INTEGER NOT NULL, PRIMARY KEY (_id));
+CREATE TABLE account (
+    _id INTEGER NOT NULL, _bank_id INTEGER, _account_number INTEGER, _account_type VARCHAR,
+    PRIMARY KEY (_id), FOREIGN KEY(_bank_id) REFERENCES bank (_id));
+CREATE TABLE "transaction" (
+    _id INTEGER NOT NULL, _amt NUMERIC, _date DATETIME, _exempt BOOLEAN, _account_id INTEGER,
+    PRIMARY KEY (_id), FOREIGN KEY(_account_id) REFERENCES account (_id));
+INSERT INTO bank VALUES (1);
+INSERT INTO account VALUES (1, 1, 1, 'savings'), (2, 1, 2, 'checking');
+INSERT INTO "transaction" VALUES
+    (1, 100.1, '2023-01-05 00:00:00.000000', 0, 1),
+    (2, -20.05, '2023-01-20 00:00:00.000000', 0, 1),
+    (3, 0.33, '2023-01-31 00:00:00.000000', 1, 1),
+    (4, 12.5, '2023-02-01 00:00:00.000000', 0, 1),
+    (5, 50, '2023-01-10 00:00:00.000000', 0, 2);
+"""
+
+
+def _baseline_engine(tmp_path, extra=""):
+    path = tmp_path / "bank.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE + extra)
+    return make_engine("batch", url=f"sqlite:///{path}", echo=False)
+
+
+def test_baseline_database_is_upgraded(tmp_path):
+    engine = _baseline_engine(tmp_path)
+    assert get_version(engine, schema.Base.metadata) == 0
+
+    assert schema.ensure_current(engine)
+    assert get_version(engine, schema.Base.metadata) == schema.SCHEMA_VERSION
+    assert not schema.ensure_current(engine)
+
+    tables = inspect(engine)
+    assert "journal_offset" in tables.get_table_names()
+    assert "ix_transaction_account_date" in {i["name"] for i in tables.get_indexes("transaction")}
+    with sessionmaker(engine)() as session:
+        bank = session.get(Bank, 1)
+        savings = bank.get_account(1)
+        assert savings.get_balance() == Decimal("92.88")
+        assert bank.get_account(2).get_balance() == Decimal("50.00")
+        assert bank.reconcile(session) == []
+        assert savings._latest_date == date(2023, 2, 1)
+        assert savings._latest_exempt_date == date(2023, 1, 31)
+        assert savings.count_transactions(session, MONTH, date(2023, 1, 1)) == 2
+        assert session.get(BalanceCheckpoint, (savings._id, date(2023, 1, 1))).get_balance() == Decimal("80.38")
+        assert savings.balance_as_of(session, date(2023, 1, 31)) == Decimal("80.38")
+        # new account numbers continue after the existing ones
+        bank.add_account(session, "checking")
+        assert bank.get_account(3) is not None
+    engine.dispose()
+
+
+def test_each_migration_only_makes_its_own_change(tmp_path):
+    engine = _baseline_engine(tmp_path)
+    assert [m.version for m in migrate(engine, schema.Base.metadata, schema.MIGRATIONS[:1])] == [1]
+    tables = inspect(engine)
+    assert "journal_offset" not in tables.get_table_names()
+    assert "ix_transaction_account_date" not in {i["name"] for i in tables.get_indexes("transaction")}
+
+    assert [m.version for m in migrate(engine, schema.Base.metadata, schema.MIGRATIONS)] == [2, 3]
+    engine.dispose()
+
+
+def test_empty_database_is_created_current(engine):
+    assert get_version(engine, schema.Base.metadata) == schema.SCHEMA_VERSION
+    assert "journal_offset" in inspect(engine).get_table_names()
+
+
+def test_baseline_leaves_out_columns_added_by_later_migrations(tmp_path, monkeypatch):
+    # as if _latest_exempt_date had been added to account by a migration after version 1
+    monkeypatch.setattr(schema, "LATER_COLUMNS", {("account", "_latest_exempt_date")})
+    migrations = schema.MIGRATIONS[:1] + [
+        Migration(2, "add account._latest_exempt_date", ("ALTER TABLE account ADD COLUMN _latest_exempt_date DATE",)),
+    ]
+    engine = _baseline_engine(tmp_path)
+    assert [m.version for m in migrate(engine, schema.Base.metadata, migrations)] == [1, 2]
+    assert "_latest_exempt_date" in {c["name"] for c in inspect(engine).get_columns("account")}
+    engine.dispose()
+
+
+def test_duplicate_account_numbers_are_renumbered(tmp_path, caplog):
+    # what two front ends opening accounts at once could leave behind before the persisted counter
+    engine = _baseline_engine(tmp_path, "INSERT INTO account VALUES (3, 1, 1, 'checking'), (4, 1, 2, 'savings');")
+
+    with caplog.at_level(logging.WARNING):
+        assert schema.ensure_current(engine)
+    assert sum("Renumbered account" in record.getMessage() for record in caplog.records) == 2
+
+    with sessionmaker(engine)() as session:
+        bank = session.get(Bank, 1)
+        assert [(a._id, a.account_number) for a in bank.show_accounts()] == [(1, 1), (2, 2), (3, 3), (4, 4)]
+        # the oldest account keeps the number, and its transactions
+        assert bank.get_account(1).get_balance() == Decimal("92.88")
+        bank.add_account(session, "checking")
+        assert bank.get_account(5) is not None
+    engine.dispose()
@@ -0,0 +1,42 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+import sqltrace
+
+
+def test_summary_is_one_statement(engine, session, bank):
+    for acct_type in ("checking", "savings", "checking"):
+        bank.add_account(session, acct_type)
+    bank.get_account(1).add_transaction(session, Decimal("10.00"), date(2023, 1, 2))
+    # loads the bank's own row, which summary doesn't need to query again
+    session.refresh(bank)
+
+    with sqltrace.statement_budget(engine, 1, "summary"):
+        rows = bank.summary(session)
+
+    assert [(acct_type, number) for acct_type, number, _ in rows] == [("checking", 1), ("savings", 2), ("checking", 3)]
+    assert rows[0][2] == Decimal("10.00")
+
+
+def test_statement_budget_fails_when_exceeded(engine):
+    with pytest.raises(AssertionError, match="executed 2 statements"):
+        with sqltrace.statement_budget(engine, 1), engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+
+
+def test_repeats_are_counted_per_run(engine):
+    with sqltrace.StatementTracer(engine) as tracer, engine.connect() as conn:
+        for _ in range(sqltrace.REPEAT_THRESHOLD):
+            with tracer.operation("command 2"):
+                conn.execute(text("SELECT 1"))
+        with tracer.operation("loop"):
+            for i in range(sqltrace.REPEAT_THRESHOLD):
+                conn.execute(text(f"SELECT {i}"))
+
+    assert tracer.count("command 2") == sqltrace.REPEAT_THRESHOLD
+    assert [(operation, shape, count) for operation, shape, count, _ in tracer.repeated()] == [
+        ("loop", "SELECT ?", sqltrace.REPEAT_THRESHOLD)]
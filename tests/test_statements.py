@@ -0,0 +1,68 @@
+import csv
+import json
+import os
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from statements import write_statements, statement_path, CSV, JSONL
+
+
+@pytest.fixture
+def statement_bank(session, bank):
+    "Five accounts: four with transactions in January and February 2023, and an empty one"
+    for acct_type in ("checking", "savings", "checking", "savings", "checking"):
+        bank.add_account(session, acct_type)
+    rows = []
+    for number in range(1, 5):
+        rows += [(number, Decimal(f"{number}00.00"), date(2023, 1, 10)),
+                 (number, Decimal("-1.50"), date(2023, 2, 3)),
+                 (number, Decimal("2.25"), date(2023, 2, 20))]
+    bank.import_transactions(session, rows)
+    bank.run_month_end(session, date(2023, 2, 1))
+    return bank
+
+
+def _read_csv(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_csv_statement_lines(session, statement_bank, tmp_path):
+    assert write_statements(session, statement_bank, date(2023, 2, 14), str(tmp_path)) == 5
+    lines = _read_csv(statement_path(str(tmp_path), 2, date(2023, 2, 1), CSV))
+    assert [(line["date"], line["description"], line["amount"], line["balance"]) for line in lines] == [
+        ("2023-02-01", "opening balance", "", "200.00"),
+        ("2023-02-03", "withdrawal", "-1.50", "198.50"),
+        ("2023-02-20", "deposit", "2.25", "200.75"),
+        ("2023-02-28", "interest", "0.66", "201.41"),
+        ("2023-02-28", "closing balance", "", "201.41"),
+    ]
+    # the closing balance is the account's balance, and an account without transactions still gets a statement
+    assert Decimal(lines[-1]["balance"]) == statement_bank.get_account(2).get_balance()
+    assert [line["description"] for line in _read_csv(statement_path(str(tmp_path), 5, date(2023, 2, 1), CSV))] == \
+        ["opening balance", "closing balance"]
+
+
+def test_jsonl_matches_csv(session, statement_bank, tmp_path):
+    write_statements(session, statement_bank, date(2023, 2, 1), str(tmp_path / "csv"))
+    write_statements(session, statement_bank, date(2023, 2, 1), str(tmp_path / "jsonl"), JSONL)
+    for number in range(1, 6):
+        with open(statement_path(str(tmp_path / "jsonl"), number, date(2023, 2, 1), JSONL)) as f:
+            records = [json.loads(line) for line in f]
+        assert records == _read_csv(statement_path(str(tmp_path / "csv"), number, date(2023, 2, 1), CSV))
+
+
+def test_workers_write_the_same_files(session, statement_bank, tmp_path):
+    assert write_statements(session, statement_bank, date(2023, 2, 1), str(tmp_path / "one")) == 5
+    assert write_statements(session, statement_bank, date(2023, 2, 1), str(tmp_path / "many"), workers=3) == 5
+    assert sorted(os.listdir(tmp_path / "many")) == sorted(os.listdir(tmp_path / "one"))
+    for name in os.listdir(tmp_path / "one"):
+        with open(tmp_path / "one" / name) as one, open(tmp_path / "many" / name) as many:
+            assert many.read() == one.read()
+
+
+def test_unknown_format(session, statement_bank, tmp_path):
+    with pytest.raises(ValueError):
+        write_statements(session, statement_bank, date(2023, 2, 1), str(tmp_path), "pdf")
@@ -1,25 +1,44 @@
-from sqlalchemy import ForeignKey, Column, Integer, Numeric, DateTime, Boolean
+from sqlalchemy import ForeignKey, Column, Integer, DateTime, Boolean, Index
 from sqlalchemy.orm import relationship, backref
 from datetime import date, timedelta
 from decimal import Decimal
 from bank import Base
+from money import Cents, round_cents
+
+
+def last_day_of_month(day) -> date:
+    "Returns a date corresponding to the last day in the same month as the given date"
+
+    # Creates a date on the first of the next month (being careful about
+    # wrapping around to January)
+    first_of_next_month = date(day.year + day.month // 12,
+                               day.month % 12 + 1, 1)
+    # Then subtracts one day
+    return first_of_next_month - timedelta(days=1)
+
 
 class Transaction(Base):
     __tablename__ = "transaction"
     _id = Column(Integer, primary_key=True)
-    _amt = Column(Numeric)
+    # stored as integer cents in a new column, older databases still have the unused NUMERIC _amt
+    _amt = Column("_amt_cents", Cents)
     _date = Column(DateTime)
     _exempt = Column(Boolean)
     _account_id = Column(Integer, ForeignKey("account._id"))
+
+    # an account's transactions are always read by date (relationship loads, statements, as-of balances)
+    __table_args__ = (
+        Index("ix_transaction_account_date", "_account_id", "_date"),
+    )
     
     def __init__(self, amt, date, exempt=False):
         """
         Args:
-            amt (Decimal): Decimal object representing dollar amount of the transaction.
+            amt (Decimal): Decimal object representing dollar amount of the transaction. Rounded to the cent.
             date (Date): Date object representing the date the transaction was created.
             exempt (bool, optional): Determines whether the transaction is exempt from account limits. Defaults to False.
         """ 
-        self._amt = amt
+        self._amt = round_cents(amt)
         self._date = date
         self._exempt = exempt
 
@@ -67,10 +86,4 @@ class Transaction(Base):
 
     def last_day_of_month(self) -> date:
         "Returns a date corresponding to the last day in the same month as this transaction"
-
-        # Creates a date on the first of the next month (being careful about
-        # wrapping around to January)
-        first_of_next_month = date(self._date.year + self._date.month // 12,
-                                   self._date.month % 12 + 1, 1)
-        # Then subtracts one day
-        return first_of_next_month - timedelta(days=1)
+        return last_day_of_month(self._date)